@@ -0,0 +1,303 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import main
+
+
+# Columnar copy of the games collection for ad-hoc report queries. A snapshot is a directory of
+# .npy files that are memory-mapped on load: the numeric columns, the developer as dictionary
+# codes, and genres/tags as dictionary codes with per-game offsets. CURRENT names the snapshot in
+# use, so a new export is swapped in with one rename while the old one keeps serving.
+#   python analytics.py export
+
+ANALYTICS_DIR = os.environ.get("ANALYTICS_DIR", "analytics_snapshot")
+# Re-export at least this often, and this long after a write so that a burst of writes lands in one export
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", 600))
+ANALYTICS_WRITE_DELAY_SECONDS = float(os.environ.get("ANALYTICS_WRITE_DELAY_SECONDS", 30))
+ANALYTICS_KEEP_SNAPSHOTS = 2
+
+METRIC_FIELDS = ["price", "positive_ratings", "negative_ratings"]
+LIST_FIELDS = ["genres", "tags"]
+DIMENSIONS = {"genre": "genres", "tag": "tags", "developer": "developer", "year": "release_year"}
+METRICS = ["count", "sum", "avg", "min", "max"]
+QUERY_RANGE_FILTERS = {
+    "min_year": ("release_year", np.greater_equal),
+    "max_year": ("release_year", np.less_equal),
+    "min_price": ("price", np.greater_equal),
+    "max_price": ("price", np.less_equal),
+    "min_ratings": ("positive_ratings", np.greater_equal),
+}
+QUERY_CODE_FILTERS = {"genre": "genres", "tag": "tags", "developer": "developer"}
+QUERY_LIMIT = 50
+QUERY_MAX_LIMIT = 1000
+
+
+def encode(vocabulary, value):
+    code = vocabulary.get(value)
+    if code is None:
+        code = vocabulary[value] = len(vocabulary)
+    return code
+
+
+def export_snapshot(directory=ANALYTICS_DIR):
+    started = time.perf_counter()
+    metrics = {field: [] for field in METRIC_FIELDS}
+    years = []
+    developers, developer_codes = {}, []
+    lists = {field: ({}, [], [0]) for field in LIST_FIELDS}
+
+    projection = dict.fromkeys(METRIC_FIELDS + LIST_FIELDS + ["developer", "release_year"], 1)
+    for game in main.database.games.find({}, projection, batch_size=10000):
+        for field in METRIC_FIELDS:
+            value = game.get(field)
+            metrics[field].append(value if main.is_number(value) else np.nan)
+        years.append(game["release_year"] if isinstance(game.get("release_year"), int) else -1)
+        developer_codes.append(encode(developers, str(game.get("developer"))))
+        for field, (vocabulary, codes, offsets) in lists.items():
+            codes.extend(encode(vocabulary, str(value)) for value in game.get(field) or [])
+            offsets.append(len(codes))
+
+    name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    arrays = {field: np.array(values, dtype='float64') for field, values in metrics.items()}
+    arrays["release_year"] = np.array(years, dtype='int32')
+    arrays["developer"] = np.array(developer_codes, dtype='int32')
+    for field, (_, codes, offsets) in lists.items():
+        arrays[f"{field}_codes"] = np.array(codes, dtype='int32')
+        arrays[f"{field}_offsets"] = np.array(offsets, dtype='int64')
+    for field, array in arrays.items():
+        np.save(os.path.join(path, f"{field}.npy"), array)
+
+    vocabularies = {"developer": list(developers)}
+    vocabularies.update((field, list(vocabulary)) for field, (vocabulary, _, _) in lists.items())
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"created": datetime.now(timezone.utc).isoformat(), "games": len(years),
+                   "vocabularies": vocabularies}, f)
+
+    pointer = os.path.join(directory, "CURRENT")
+    with open(f"{pointer}.{os.getpid()}", "w") as f:
+        f.write(name)
+    os.replace(f"{pointer}.{os.getpid()}", pointer)
+    prune_snapshots(directory, name)
+    print(f"Exported analytics snapshot of {len(years)} games in {time.perf_counter() - started:.2f}s")
+    return name
+
+
+# Old snapshots may still be mapped by other workers; that is fine on POSIX, elsewhere they stay until the next prune
+def prune_snapshots(directory, current):
+    names = sorted(entry for entry in os.listdir(directory)
+                   if entry != current and os.path.isdir(os.path.join(directory, entry)))
+    for name in names[:max(0, len(names) - ANALYTICS_KEEP_SNAPSHOTS + 1)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def current_snapshot_name(directory=ANALYTICS_DIR):
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.size = self.meta["games"]
+        self.vocabularies = self.meta["vocabularies"]
+        self.codes = {field: {value: code for code, value in enumerate(values)}
+                      for field, values in self.vocabularies.items()}
+        mmap_mode = 'r' if self.size else None
+        self.columns = {name[:-4]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                        for name in os.listdir(path) if name.endswith(".npy")}
+        self.entry_rows = {}
+
+    # Game row of every genres/tags entry, which explodes a list field for a group-by or a filter
+    def rows_of(self, field):
+        if field not in self.entry_rows:
+            offsets = self.columns[f"{field}_offsets"]
+            self.entry_rows[field] = np.repeat(np.arange(self.size), np.diff(offsets))
+        return self.entry_rows[field]
+
+
+class SnapshotManager:
+    def __init__(self, directory=ANALYTICS_DIR, refresh_seconds=ANALYTICS_REFRESH_SECONDS,
+                 write_delay=ANALYTICS_WRITE_DELAY_SECONDS):
+        self.directory = directory
+        self.refresh_seconds = refresh_seconds
+        self.write_delay = write_delay
+        self.snapshot = None
+        self.loaded = None
+        self.lock = threading.Lock()
+        self.scheduler = None
+
+    # The snapshot named by CURRENT, exported on the first query when there is none yet
+    def current(self):
+        with self.lock:
+            name = current_snapshot_name(self.directory)
+            if name is None:
+                main.games_changed.clear()
+                name = export_snapshot(self.directory)
+            if name != self.loaded:
+                self.snapshot = Snapshot(os.path.join(self.directory, name))
+                self.loaded = name
+            if self.scheduler is None and self.refresh_seconds:
+                self.scheduler = threading.Thread(target=self.refresh_loop, daemon=True)
+                self.scheduler.start()
+            return self.snapshot
+
+    def refresh_loop(self):
+        while True:
+            if main.games_changed.wait(self.refresh_seconds):
+                time.sleep(self.write_delay)
+            main.games_changed.clear()
+            try:
+                export_snapshot(self.directory)
+            except Exception as e:
+                print(f"Analytics snapshot export failed: {e}")
+
+
+snapshots = SnapshotManager()
+
+
+def parse_query(args):
+    group_by = [dimension for dimension in args.get('group_by', 'genre').split(',') if dimension]
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Invalid group_by '{dimension}'. Valid options are {list(DIMENSIONS)}")
+    if not 0 < len(group_by) <= 2 or len(set(group_by)) != len(group_by):
+        raise ValueError("'group_by' takes one or two different dimensions")
+    if sum(DIMENSIONS[dimension] in LIST_FIELDS for dimension in group_by) > 1:
+        raise ValueError("'group_by' can only include one of 'genre' and 'tag'")
+
+    metric, _, field = args.get('metric', 'avg:positive_ratings').partition(':')
+    if metric not in METRICS:
+        raise ValueError(f"Invalid metric '{metric}'. Valid options are {METRICS}")
+    if metric != "count" and field not in METRIC_FIELDS:
+        raise ValueError(f"Metric '{metric}' needs a field, one of {METRIC_FIELDS}, e.g. '{metric}:price'")
+
+    filters = {}
+    for key, value in args.items():
+        if key in QUERY_RANGE_FILTERS:
+            try:
+                filters[key] = float(value)
+            except ValueError:
+                raise ValueError(f"Invalid value '{value}' for '{key}', expected a number")
+        elif key in QUERY_CODE_FILTERS:
+            filters[key] = value
+        elif key not in ("group_by", "metric", "sort", "limit"):
+            raise ValueError(f"Unknown filter '{key}'. Valid options are "
+                             f"{list(QUERY_RANGE_FILTERS) + list(QUERY_CODE_FILTERS)}")
+
+    sort = args.get('sort', '-value')
+    if sort not in ("value", "-value", "key"):
+        raise ValueError(f"Invalid sort '{sort}'. Valid options are ['value', '-value', 'key']")
+    try:
+        limit = int(args.get('limit', QUERY_LIMIT))
+    except ValueError:
+        raise ValueError(f"'limit' must be an integer between 1 and {QUERY_MAX_LIMIT}")
+    if not 0 < limit <= QUERY_MAX_LIMIT:
+        raise ValueError(f"'limit' must be between 1 and {QUERY_MAX_LIMIT}")
+    return {"group_by": group_by, "metric": metric, "field": field or None, "filters": filters,
+            "sort": sort, "limit": limit}
+
+
+def filter_mask(snapshot, filters):
+    columns = snapshot.columns
+    mask = np.ones(snapshot.size, dtype=bool)
+    for key, value in filters.items():
+        if key in QUERY_RANGE_FILTERS:
+            field, compare = QUERY_RANGE_FILTERS[key]
+            mask &= compare(columns[field], value)
+            if field == "release_year":
+                # Unknown years are stored as -1, which would otherwise pass every max_year
+                mask &= columns[field] >= 0
+            continue
+        field = QUERY_CODE_FILTERS[key]
+        code = snapshot.codes[field].get(value)
+        if code is None:
+            mask[:] = False
+        elif field in LIST_FIELDS:
+            matches = np.zeros(snapshot.size, dtype=bool)
+            matches[snapshot.rows_of(field)[columns[f"{field}_codes"] == code]] = True
+            mask &= matches
+        else:
+            mask &= columns[field] == code
+    return mask
+
+
+def group_label(field, snapshot, code):
+    if field == "release_year":
+        return None if code < 0 else int(code)
+    return snapshot.vocabularies[field][code]
+
+
+# Vectorized group-by: genres/tags are exploded to one row per entry, the group keys are made unique
+# with np.unique and the metric is reduced per group with bincount (count/sum/avg) or reduceat (min/max)
+def run_query(snapshot, group_by, metric, field, filters, sort, limit):
+    columns = snapshot.columns
+    mask = filter_mask(snapshot, filters)
+    fields = [DIMENSIONS[dimension] for dimension in group_by]
+
+    list_field = next((f for f in fields if f in LIST_FIELDS), None)
+    if list_field:
+        entry_rows = snapshot.rows_of(list_field)
+        keep = mask[entry_rows]
+        rows = entry_rows[keep]
+        list_codes = columns[f"{list_field}_codes"][keep]
+    else:
+        rows = np.flatnonzero(mask)
+    keys = np.stack([list_codes if f == list_field else columns[f][rows] for f in fields], axis=1)
+
+    values = columns[field][rows] if field else np.zeros(len(rows))
+    valid = ~np.isnan(values)
+    keys, values = keys[valid], values[valid]
+    if not len(keys):
+        return []
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse, minlength=len(groups))
+    if metric == "count":
+        results = counts.astype('float64')
+    elif metric in ("sum", "avg"):
+        results = np.bincount(inverse, weights=values, minlength=len(groups))
+        if metric == "avg":
+            results = results / counts
+    else:
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        reduce = np.minimum if metric == "min" else np.maximum
+        results = reduce.reduceat(values[order], starts)
+
+    def row(i):
+        labels = {dimension: group_label(f, snapshot, code) for dimension, f, code in zip(group_by, fields, groups[i])}
+        return dict(labels, value=float(results[i]), games=int(counts[i]))
+
+    if sort == "key":
+        rows = [row(i) for i in range(len(groups))]
+        rows.sort(key=lambda r: [(r[dimension] is not None, r[dimension]) for dimension in group_by])
+        return rows[:limit]
+    order = np.argsort(results if sort == "value" else -results, kind='stable')
+    return [row(i) for i in order[:limit]]
+
+
+def query(args):
+    spec = parse_query(args)
+    snapshot = snapshots.current()
+    return {"rows": run_query(snapshot, **spec),
+            "snapshot": {"created": snapshot.meta["created"], "games": snapshot.size}}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ["export"]:
+        print("Usage: python analytics.py export")
+        sys.exit(2)
+    export_snapshot()
@@ -0,0 +1,484 @@
+import asyncio
+import os
+import re
+import time
+
+import uvicorn
+from pymongo import AsyncMongoClient, ReturnDocument
+from quart import Quart, Response, request, jsonify, g, redirect, send_file
+from quart.wrappers.response import IterableBody
+
+import main
+
+
+# Async variant of the Flask routes in main.py, served by an ASGI server. Queries and
+# validation are shared with main.py; only the Mongo round trips are awaited here. It has
+# no response cache, and similarity-index maintenance runs on a thread with the sync client.
+app = Quart(__name__)
+app.json = main.FastJSONProvider(app)
+client = AsyncMongoClient(main.MONGO_URI, event_listeners=[main.query_monitor], **main.mongo_client_options())
+database = client[main.MONGO_DB]
+
+
+async def update_reports(removed=(), added=()):
+    operations = main.report_operations(removed, added)
+    if operations:
+        await database.report_stats.bulk_write(operations, ordered=False)
+
+
+async def read_report(name):
+    stats = await database.report_stats.find(**main.report_find_args(name)).to_list(None)
+    return main.report_result(name, stats)
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    main.record_request(route, request.method, response.status_code,
+                        time.perf_counter() - g.get("request_started", time.perf_counter()), response.content_length)
+    return response
+
+
+async def compress_async_stream(chunks, encoding):
+    compress_chunk, finish = main.stream_compressor(encoding)
+    async for chunk in chunks:
+        yield compress_chunk(chunk)
+    yield finish()
+
+
+# Runs before the metrics hook, like in main.py
+@app.after_request
+async def compress_response(response):
+    if not main.compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = main.response_encoding(request.accept_encodings)
+    if encoding and isinstance(response.response, IterableBody):
+        response.response = IterableBody(compress_async_stream(response.response, encoding))
+        response.headers.pop("Content-Length", None)
+        main.mark_compressed(response, encoding)
+        return response
+    body = await response.get_data() if encoding else b""
+    if len(body) < main.COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(main.compress(body, encoding))
+    main.mark_compressed(response, encoding)
+    return response
+
+
+# Metrics of this worker process only; with several workers each scrape sees one of them
+#http://127.0.0.1:8000/metrics
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(main.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+#http://127.0.0.1:8000/games
+@app.route('/games', methods=['GET'])
+async def get_games():
+    try:
+        projection = main.field_projection(request.args, main.GAMES_PROJECTION)
+        query = main.build_games_query(request.args.to_dict())
+        find_args, sort_field, limit = main.page_request(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = await database.games.find(**find_args).to_list(None)
+    games, next_cursor = main.page_response(games, sort_field, limit, projection)
+    return jsonify({"games": games, "after": next_cursor})
+
+
+#http://127.0.0.1:8000/games/facets?genres=Action&max_price=20
+@app.route('/games/facets', methods=['GET'])
+async def get_game_facets():
+    try:
+        projection = main.field_projection(request.args, main.GAMES_PROJECTION)
+        query = main.build_games_query(request.args.to_dict())
+        pipeline, collation, sort_field, limit = main.facets_pipeline(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    cursor = await database.games.aggregate(pipeline, collation=collation)
+    result = await cursor.next()
+    return jsonify(main.facets_response(result, sort_field, limit, projection))
+
+
+#http://127.0.0.1:8000/reports/top_genres
+@app.route('/reports/top_genres', methods=['GET'])
+async def top_genres():
+    return jsonify(await read_report("top_genres"))
+
+
+#http://127.0.0.1:8000/reports/leaderboard/genre/Action?k=25
+@app.route('/reports/leaderboard/<dimension>/<path:key>', methods=['GET'])
+async def leaderboard(dimension, key):
+    try:
+        query, projection = main.leaderboard_args(dimension, key, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    board = await database.leaderboards.find_one(query, projection)
+    if board is None:
+        return jsonify({"error": f"No leaderboard for {dimension} '{key}'"}), 404
+    return jsonify(main.leaderboard_result(query, board))
+
+
+#http://127.0.0.1:8000/reports/price-trend
+@app.route('/reports/price-trend', methods=['GET'])
+async def price_trend():
+    return jsonify(await read_report("price_trend"))
+
+
+#http://127.0.0.1:8000/reports/top_genres_by_year
+@app.route('/reports/top_genres_by_year', methods=['GET'])
+async def top_genres_by_year():
+    return jsonify(await read_report("top_genres_by_year"))
+
+
+#http://127.0.0.1:8000/reports/developer_genre_ratings
+@app.route('/reports/developer_genre_ratings', methods=['GET'])
+async def developer_genre_ratings():
+    return jsonify(await read_report("developer_genre_ratings"))
+
+
+# Runs on a thread: the vectorized group-by holds the GIL only in short stretches
+#http://127.0.0.1:8000/reports/query?group_by=genre&metric=avg:positive_ratings
+@app.route('/reports/query', methods=['GET'])
+async def report_query():
+    import analytics
+
+    try:
+        result = await asyncio.to_thread(analytics.query, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+# Every report in one response, with the report queries running concurrently
+#http://127.0.0.1:8000/reports/summary
+@app.route('/reports/summary', methods=['GET'])
+async def reports_summary():
+    names = list(main.REPORTS)
+    results = await asyncio.gather(*(read_report(name) for name in names))
+    return jsonify(dict(zip(names, results)))
+
+
+#http://127.0.0.1:8000/recommendations/Dota 2
+@app.route('/recommendations/<game_name>', methods=['GET'])
+async def recommend_games(game_name):
+    try:
+        k, query, rank = main.recommendation_args(request.args)
+        projection = main.field_projection(request.args, main.RECOMMENDATION_PROJECTION)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    game = await database.games.find_one({"name": game_name}, {"_id": 1}, collation=main.CASE_INSENSITIVE)
+    if not game:
+        return jsonify({"error": "Game not found"}), 404
+
+    entry = await database.similar_games.find_one({"_id": game["_id"]})
+    if entry is None:
+        await asyncio.to_thread(main.update_similarity, [game["_id"]])
+        entry = await database.similar_games.find_one({"_id": game["_id"]}) or {"neighbours": []}
+    scores = {neighbour["_id"]: neighbour["score"] for neighbour in entry["neighbours"]}
+
+    query["_id"] = {"$in": list(scores)}
+    recommendations = await database.games.find(query, dict(projection, _id=1, positive_ratings=1)).to_list(None)
+    return jsonify({"recommended_games": main.rank_recommendations(recommendations, scores, rank, k, projection)})
+
+
+#http://127.0.0.1:8000/requirements/Counter-strike/windows
+@app.route('/requirements/<game_name>/<system>', methods=['GET'])
+async def get_system_requirements(game_name, system):
+    valid_systems = ['windows', 'mac', 'linux']
+    if system.lower() not in valid_systems:
+        return jsonify({"error": f"Invalid system '{system}'. Valid options are {valid_systems}"}), 400
+
+    projection = {"_id": 0, f"{system.lower()}_requirements": 1, "name": 1}
+    game = await database.games.find_one({"name": game_name}, projection, collation=main.CASE_INSENSITIVE)
+    if not game:
+        return jsonify({"error": f"Game '{game_name}' not found"}), 404
+
+    requirements = game.get(f"{system.lower()}_requirements", "No Data Available")
+    if requirements == "No Data Available":
+        return jsonify({"message": f"System requirements for '{system}' are not available for '{game_name}'"}), 404
+
+    return jsonify({
+        "game": game_name,
+        "system": system,
+        "requirements": requirements
+    })
+
+
+#http://127.0.0.1:8000/games/runs-on?system=linux&ram_gb=4
+@app.route('/games/runs-on', methods=['GET'])
+async def games_runs_on():
+    try:
+        projection = dict(main.field_projection(request.args, main.GAMES_PROJECTION))
+        requirement = main.runs_on_requirement(request.args)
+        query = main.build_games_query({key: value for key, value in request.args.to_dict().items()
+                                        if key not in main.RUNS_ON_ARGS})
+        query["system_requirements"] = {"$elemMatch": requirement}
+        projection["system_requirements"] = {"$elemMatch": {"system": requirement["system"],
+                                                            "level": requirement["level"]}}
+        find_args, sort_field, limit = main.page_request(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = await database.games.find(**find_args).to_list(None)
+    games, next_cursor = main.page_response(games, sort_field, limit, projection)
+    return jsonify({"games": games, "after": next_cursor})
+
+
+# The index lookup and the queueing of a download touch sqlite, so they run on a thread
+#http://127.0.0.1:8000/games/10/header_img?width=460
+@app.route('/games/<int:game_id>/<any(header_img, background_img):field>', methods=['GET'])
+async def get_game_image(game_id, field):
+    import media
+
+    try:
+        width = media.image_width(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    game = await database.games.find_one({"_id": game_id}, {"_id": 0, field: 1})
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+
+    url = game.get(field)
+    if not isinstance(url, str) or not re.match(r'https?://', url):
+        return jsonify({"error": f"Image '{field}' for game '{game_id}' is not available"}), 404
+    entry = await asyncio.to_thread(media.cached_image, url, width)
+    if entry is None:
+        return redirect(url)
+    try:
+        response = await send_file(entry["path"], mimetype=entry["mimetype"], add_etags=False,
+                                   cache_timeout=media.MEDIA_MAX_AGE)
+    except FileNotFoundError:
+        return redirect(url)
+    response.set_etag(entry["digest"])
+    return await response.make_conditional(request, accept_ranges=True, complete_length=entry["size"])
+
+
+#http://127.0.0.1:8000/games/30/website
+@app.route('/games/<int:game_id>/website', methods=['GET'])
+async def get_game_website(game_id):
+    game = await database.games.find_one({"_id": game_id}, {"_id": 0, "website": 1})
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+
+    website = game.get("website")
+    if not isinstance(website, str) or not re.match(r'https?://', website):
+        return jsonify({"error": f"Website for game '{game_id}' is not available"}), 404
+    return redirect(website)
+
+
+#http://127.0.0.1:8000/media/stats
+@app.route('/media/stats', methods=['GET'])
+async def media_stats():
+    import media
+
+    return jsonify(await asyncio.to_thread(media.stats))
+
+
+# Sends a batch of games per chunk as the cursor reads them
+async def generate_export(first_game, cursor, export_format, fields, batch_size):
+    try:
+        yield main.export_text([first_game], export_format, fields, header=True).encode('utf-8')
+        games = []
+        async for game in cursor:
+            games.append(game)
+            if len(games) >= batch_size:
+                yield main.export_text(games, export_format, fields).encode('utf-8')
+                games = []
+        if games:
+            yield main.export_text(games, export_format, fields).encode('utf-8')
+    finally:
+        await cursor.close()
+
+
+#http://127.0.0.1:8000/games/export?min_price=5&max_price=20&format=ndjson
+@app.route('/games/export', methods=['GET'])
+async def export_games():
+    try:
+        find_args, export_format, fields = main.export_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = database.games.find(**find_args)
+    first_game = await anext(cursor, None)
+    if first_game is None:
+        await cursor.close()
+        return jsonify({"error": "No games found matching the criteria"}), 404
+
+    chunks = generate_export(first_game, cursor, export_format, fields, find_args["batch_size"])
+    if request.args.get('gzip', '').lower() in ('1', 'true'):
+        return Response(compress_async_stream(chunks, "gzip"), mimetype='application/gzip',
+                        headers=main.export_headers(export_format, True))
+    return Response(chunks, mimetype=main.EXPORT_FORMATS[export_format],
+                    headers=main.export_headers(export_format, False))
+
+
+#http://127.0.0.1:8000/search?q=zombie survival&page=2
+@app.route('/search', methods=['GET'])
+async def search_games():
+    try:
+        find_args, page, limit = main.search_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = await database.games.find(**find_args).to_list(None)
+    return jsonify({"games": games[:limit], "page": page, "has_more": len(games) > limit})
+
+
+#http://127.0.0.1:8000/search/autocomplete?prefix=counter
+@app.route('/search/autocomplete', methods=['GET'])
+async def autocomplete_games():
+    try:
+        find_args = main.autocomplete_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = await database.games.find(**find_args).to_list(None)
+    return jsonify({"names": [game["name"] for game in games]})
+
+
+# The batch writes and the report, leaderboard and similarity maintenance after them are the ones of
+# main.py, run on a thread with the sync client
+#http://127.0.0.1:8000/games/bulk
+@app.route('/games/bulk', methods=['POST'])
+async def bulk_games():
+    try:
+        items = main.parse_bulk_items(request.mimetype, await request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = await asyncio.to_thread(main.run_bulk, items)
+    if result["ok"]:
+        main.games_changed.set()
+    return jsonify(result), 200
+
+
+@app.route('/games', methods=['POST'])
+async def add_game():
+    data = await request.get_json()
+
+    error = main.game_validation_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        await database.games.insert_one(main.add_derived_fields(data))
+    except Exception as e:
+        return jsonify({"error": f"Failed to add game: {str(e)}"}), 500
+
+    main.games_changed.set()
+    await update_reports(added=[data])
+    await asyncio.to_thread(main.update_leaderboards, added=[data])
+    await asyncio.to_thread(main.update_similarity, [data["_id"]])
+    return jsonify({"message": "Game added successfully"}), 201
+
+
+@app.route('/games/<game_id>', methods=['PUT'])
+async def edit_game(game_id):
+    try:
+        game_id = int(game_id)
+    except ValueError:
+        return jsonify({"error": f"Invalid game ID '{game_id}'"}), 400
+    data = await request.get_json()
+    error = main.field_validation_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+    data = main.add_derived_fields(data)
+
+    try:
+        game = await database.games.find_one_and_update({"_id": game_id}, {"$set": data},
+                                                        return_document=ReturnDocument.BEFORE)
+    except Exception as e:
+        return jsonify({"error": f"Failed to update game: {str(e)}"}), 500
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+
+    main.games_changed.set()
+    await update_reports(removed=[game], added=[dict(game, **data)])
+    if any(field in data for field in main.REQUIREMENT_SYSTEMS.values()):
+        await asyncio.to_thread(main.refresh_system_requirements, [game["_id"]])
+    if "wilson_score" not in data and ("positive_ratings" in data or "negative_ratings" in data):
+        await asyncio.to_thread(main.refresh_wilson_scores, [game["_id"]])
+    if any(field in data for field in main.LEADERBOARD_FIELDS):
+        await asyncio.to_thread(main.update_leaderboards, removed=[game], added=[dict(game, **data)])
+    if "genres" in data or "tags" in data:
+        await asyncio.to_thread(main.update_similarity, [game["_id"]])
+    return jsonify({"message": "Game updated successfully"}), 200
+
+
+@app.route('/games/<game_id>', methods=['DELETE'])
+async def delete_game(game_id):
+    try:
+        game_id = int(game_id)
+    except ValueError:
+        return jsonify({"error": f"Invalid game ID '{game_id}'"}), 400
+    try:
+        game = await database.games.find_one_and_delete({"_id": game_id})
+    except Exception as e:
+        return jsonify({"error": f"Failed to delete game: {str(e)}"}), 500
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+
+    main.games_changed.set()
+    await update_reports(removed=[game])
+    await asyncio.to_thread(main.update_leaderboards, removed=[game])
+    await asyncio.to_thread(main.remove_from_similarity, [game["_id"]])
+    return jsonify({"message": f"Game with ID {game_id} deleted successfully"}), 200
+
+
+@app.route('/games/bulk_update_price', methods=['PUT'])
+async def bulk_update_price():
+    data = await request.form or await request.get_json() or {}
+    try:
+        query = main.bulk_price_query(data)
+        discount_percentage = float(data.get('discount_percentage', 10)) / 100
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    dry_run = str(data.get('dry_run', '')).lower() in ('1', 'true')
+
+    if not query:
+        return jsonify({"error": "Missing 'developer' or 'filter' parameter"}), 400
+
+    collation = main.query_collation(query)
+    cursor = await database.games.aggregate(main.price_totals_pipeline(query, discount_percentage),
+                                            collation=collation)
+    totals = await cursor.to_list(None)
+    matched = sum(total["count"] for total in totals)
+    price_delta = sum(total["new_price"] - total["old_price"] for total in totals)
+
+    if not matched:
+        return jsonify({"error": "No games found matching the criteria"}), 404
+    if dry_run:
+        return jsonify({"dry_run": True, "matched": matched, "price_delta": price_delta}), 200
+
+    result = await database.games.update_many(query, [{"$set": {"price": main.discounted_price(discount_percentage)}}],
+                                              collation=collation)
+    main.games_changed.set()
+    await update_reports(*main.price_totals_changes(totals))
+
+    return jsonify({
+        "message": f"Prices updated for {result.modified_count} games",
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "price_delta": price_delta,
+    }), 200
+
+
+# Production launcher: several uvicorn worker processes, each with its own Mongo connection pool
+def serve():
+    uvicorn.run(
+        "asgi_server:app",
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("PORT", 8000)),
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        timeout_keep_alive=int(os.environ.get("KEEP_ALIVE_TIMEOUT", 5)),
+        log_level=os.environ.get("LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+
+# Benchmarks ingestion and the HTTP routes against a local mongod. Results are written as JSON
+# so that runs can be compared:
+#   python generate_catalog.py bench_data --games 100000
+#   python benchmark.py ingest bench_data
+#   python benchmark.py routes --duration 30 --concurrency 16
+#   python benchmark.py compare results/a.json results/b.json
+# Both commands use their own database (--db, default steam_bench) so the real catalog is left alone.
+
+WRITE_ID_BASE = 900000000
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def save_results(results, output):
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def run_ingest(args):
+    import ingest
+    import main
+
+    for collection in ("games", "report_stats", "leaderboards", "similar_games", "similarity_meta"):
+        main.database.drop_collection(collection)
+    # A fresh HTML cache for every run, so the cleaning is timed cold rather than against the cache a
+    # previous run filled
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        ingest.create_steam_db(args.data_dir, batch_size=args.batch_size, workers=args.workers,
+                               html_cache=os.path.join(cache_dir, "html_cache.sqlite"),
+                               memory_budget_mb=args.memory_budget)
+        elapsed = time.perf_counter() - started
+    games = main.database.games.estimated_document_count()
+    return {
+        "benchmark": "ingest",
+        "data_dir": args.data_dir,
+        "games": games,
+        "seconds": elapsed,
+        "games_per_second": games / elapsed if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "memory_budget_mb": args.memory_budget,
+    }
+
+
+# One request per route, filled in with names, developers and ids sampled from the catalog. The image
+# routes are left out: on a cache miss they queue a download from the image CDN.
+def route_requests(main, rng):
+    sample = list(main.database.games.aggregate([
+        {"$sample": {"size": 200}}, {"$project": {"name": 1, "developer": 1, "genres": 1}}]))
+    if not sample:
+        raise SystemExit("The benchmark database is empty, run 'python benchmark.py ingest <data_dir>' first")
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_examples.txt")) as f:
+        text = f.read()
+    new_game = json.loads(text[text.index('{'):text.index('}') + 1])
+    counter = iter(range(WRITE_ID_BASE, WRITE_ID_BASE + 10 ** 8))
+
+    def game():
+        return rng.choice(sample)
+
+    def quote(value):
+        return urllib.parse.quote(str(value), safe='')
+
+    added = []
+
+    def add_game():
+        game_id = next(counter)
+        added.append(game_id)
+        return "POST", "/games", dict(new_game, _id=game_id, name=f"Benchmark Game {game_id}")
+
+    def delete_game():
+        return "DELETE", f"/games/{added.pop() if added else next(counter)}", None
+
+    def bulk_games():
+        ids = [next(counter) for _ in range(50)]
+        return "POST", "/games/bulk", [{"op": "insert", "game": dict(new_game, _id=game_id, name=f"Benchmark Game {game_id}")}
+                                       for game_id in ids]
+
+    return {
+        "GET /games": lambda: ("GET", f"/games?genres={quote(rng.choice(game().get('genres') or ['Action']))}"
+                                      f"&sort=-positive_ratings&limit=50", None),
+        "GET /games?fields=": lambda: ("GET", "/games?fields=name,price&sort=-positive_ratings&limit=500", None),
+        "GET /games/facets": lambda: ("GET", f"/games/facets?genres={quote(rng.choice(game().get('genres') or ['Action']))}"
+                                             f"&max_price=20", None),
+        "GET /games/runs-on": lambda: ("GET", f"/games/runs-on?system={rng.choice(['windows', 'mac', 'linux'])}"
+                                              f"&ram_gb={rng.choice([2, 4, 8])}&limit=50", None),
+        "GET /games/<id>/website": lambda: ("GET", f"/games/{game()['_id']}/website", None),
+        "GET /games/export": lambda: ("GET", "/games/export?min_price=5&max_price=6&limit=1000", None),
+        "GET /games/export?format=ndjson": lambda: ("GET", "/games/export?min_price=5&max_price=6&limit=1000&format=ndjson", None),
+        "GET /reports/top_genres": lambda: ("GET", "/reports/top_genres", None),
+        "GET /reports/price-trend": lambda: ("GET", "/reports/price-trend", None),
+        "GET /reports/top_genres_by_year": lambda: ("GET", "/reports/top_genres_by_year", None),
+        "GET /reports/developer_genre_ratings": lambda: ("GET", "/reports/developer_genre_ratings", None),
+        "GET /reports/leaderboard": lambda: ("GET", f"/reports/leaderboard/genre/"
+                                                    f"{quote(rng.choice(game().get('genres') or ['Action']))}", None),
+        "GET /reports/query": lambda: ("GET", "/reports/query?group_by=" + rng.choice(["genre", "year", "developer"])
+                                              + "&metric=avg:positive_ratings&sort=-value&limit=10", None),
+        "GET /recommendations": lambda: ("GET", f"/recommendations/{quote(game()['name'])}", None),
+        "GET /requirements": lambda: ("GET", f"/requirements/{quote(game()['name'])}/windows", None),
+        "GET /search": lambda: ("GET", "/search?q=" + quote(rng.choice(["zombie", "space", "puzzle", "dark"])), None),
+        "GET /search/autocomplete": lambda: ("GET", "/search/autocomplete?prefix=" + quote(game()['name'][:3]), None),
+        "POST /games": add_game,
+        "PUT /games/<id>": lambda: ("PUT", f"/games/{game()['_id']}", {"website": "https://example.com"}),
+        "PUT /games/bulk_update_price": lambda: ("PUT", "/games/bulk_update_price",
+                                                 {"developer": game()['developer'], "dry_run": True}),
+        "DELETE /games/<id>": delete_game,
+        "POST /games/bulk": bulk_games,
+    }
+
+
+# Redirects (the website route) are measured as they are, not followed to the other site
+class KeepRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+opener = urllib.request.build_opener(KeepRedirects)
+
+
+# The size is the number of bytes received, so with accept_encoding set it is the compressed size
+def send(base_url, method, path, body, accept_encoding=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    headers = {"Content-Type": "application/json"}
+    if accept_encoding:
+        headers["Accept-Encoding"] = accept_encoding
+    request = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=60) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    except OSError:
+        size, status = 0, None
+    return time.perf_counter() - started, status, size
+
+
+def start_flask_server(main):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# Deletes the games the write routes added, then rebuilds the reports, leaderboards and similarity index
+# so they match the catalog the run started from. Removing the games one by one as DELETE /games/<id>
+# does would leave empty report and leaderboard entries behind and neighbour lists short of
+# SIMILARITY_TOP_K.
+def remove_written_games(main):
+    import ingest
+    if main.similarity_updates is not None:
+        main.similarity_updates.join()
+    if main.database.games.delete_many({"_id": {"$gte": WRITE_ID_BASE}}).deleted_count:
+        main.rebuild_reports()
+        main.rebuild_leaderboards()
+        ingest.build_similarity_index()
+    main.response_cache.invalidate()
+
+
+def run_routes(args):
+    import main
+
+    rng = random.Random(args.seed)
+    requests = route_requests(main, rng)
+    if args.routes:
+        requests = {name: make for name, make in requests.items() if any(r in name for r in args.routes)}
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = start_flask_server(main)
+
+    samples = {name: [] for name in requests}
+    deadline = time.monotonic() + args.duration
+    names = list(requests)
+
+    def worker():
+        while time.monotonic() < deadline:
+            name = rng.choice(names)
+            method, path, body = requests[name]()
+            samples[name].append(send(base_url, method, path, body, args.accept_encoding))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(args.concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    if server is not None:
+        server.shutdown()
+    remove_written_games(main)
+
+    routes = {}
+    for name, results in samples.items():
+        latencies = [latency * 1000 for latency, _, _ in results]
+        routes[name] = {
+            "requests": len(results),
+            "errors": sum(1 for _, status, _ in results if status is None or status >= 500),
+            "throughput_rps": len(results) / elapsed,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_bytes": sum(size for _, _, size in results) / len(results) if results else None,
+        }
+    return {
+        "benchmark": "routes",
+        "url": args.url or "in-process Flask server",
+        "concurrency": args.concurrency,
+        "accept_encoding": args.accept_encoding,
+        "seconds": elapsed,
+        "requests": sum(route["requests"] for route in routes.values()),
+        "throughput_rps": sum(route["requests"] for route in routes.values()) / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "routes": routes,
+    }
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{'route':<40}{'p50 before':>12}{'p50 after':>12}{'p99 before':>12}{'p99 after':>12}"
+          f"{'bytes before':>14}{'bytes after':>14}")
+    for name, route in after.get("routes", {}).items():
+        old = before.get("routes", {}).get(name, {})
+        print(f"{name:<40}{old.get('p50_ms') or 0:>12.1f}{route['p50_ms'] or 0:>12.1f}"
+              f"{old.get('p99_ms') or 0:>12.1f}{route['p99_ms'] or 0:>12.1f}"
+              f"{old.get('mean_bytes') or 0:>14.0f}{route['mean_bytes'] or 0:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and the HTTP routes")
+    parser.add_argument('--db', default='steam_bench', help="Mongo database used for the benchmark")
+    parser.add_argument('--output', help="JSON file for the results (default results/<benchmark>-<time>.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help="time create_steam_db on a generated catalog")
+    ingest.add_argument('data_dir')
+    ingest.add_argument('--batch-size', type=int, default=5000)
+    ingest.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ingest.add_argument('--memory-budget', type=int, default=2048, help="INGEST_MEMORY_BUDGET_MB for the run")
+
+    routes = commands.add_parser('routes', help="drive every route concurrently")
+    routes.add_argument('--url', help="benchmark a running server instead of an in-process Flask server")
+    routes.add_argument('--duration', type=float, default=30)
+    routes.add_argument('--concurrency', type=int, default=16)
+    routes.add_argument('--routes', nargs='*', help="only run routes whose name contains one of these strings")
+    routes.add_argument('--seed', type=int, default=0)
+    routes.add_argument('--accept-encoding', help="Accept-Encoding header to send, e.g. 'gzip' or 'br'")
+
+    diff = commands.add_parser('compare', help="compare the route latencies of two result files")
+    diff.add_argument('before')
+    diff.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args)
+        return
+
+    # main.py reads MONGO_DB when it is imported
+    os.environ["MONGO_DB"] = args.db
+    results = run_ingest(args) if args.command == 'ingest' else run_routes(args)
+    results.update(timestamp=datetime.now(timezone.utc).isoformat(), commit=git_commit(), python=sys.version.split()[0])
+    print(json.dumps(results, indent=2))
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    save_results(results, args.output or os.path.join("results", f"{args.command}-{stamp}.json"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Writes a synthetic Steam catalog with the same six CSV files and columns as the Kaggle
+# dataset ingest.create_steam_db loads, in chunks so that millions of games fit in memory.
+#   python generate_catalog.py bench_data --games 100000
+
+GENRES = ["Indie", "Action", "Casual", "Adventure", "Strategy", "Simulation", "RPG", "Early Access",
+          "Free to Play", "Sports", "Racing", "Massively Multiplayer", "Violent", "Gore", "Nudity",
+          "Sexual Content", "Design & Illustration", "Animation & Modeling", "Utilities", "Education"]
+TAGS = ["Indie", "Action", "Casual", "Adventure", "Strategy", "Simulation", "RPG", "Early Access", "Puzzle",
+        "Free to Play", "Platformer", "Singleplayer", "Multiplayer", "Shooter", "FPS", "Horror", "Survival",
+        "Open World", "Sandbox", "Pixel Graphics", "Anime", "Visual Novel", "Racing", "Sports", "Rogue-like",
+        "Point & Click", "Story Rich", "Sci-fi", "Fantasy", "Arcade", "Retro", "2D", "3D", "Co-op", "VR",
+        "Tower Defense", "Turn-Based", "RTS", "MOBA", "Card Game", "Hidden Object", "Management", "Building",
+        "Space", "Zombies", "Atmospheric", "Great Soundtrack", "Difficult", "Funny", "Cute", "Exploration",
+        "Stealth", "Hack and Slash", "Metroidvania", "Bullet Hell", "Roguelite", "Crafting", "Physics",
+        "Massively Multiplayer", "Female Protagonist", "Dark", "Psychological Horror", "Music", "Rhythm"]
+CATEGORIES = ["Single-player", "Multi-player", "Online Multi-Player", "Local Multi-Player", "Co-op",
+              "Steam Achievements", "Steam Trading Cards", "Steam Cloud", "Full controller support",
+              "Partial Controller Support", "Steam Leaderboards", "Steam Workshop", "In-App Purchases"]
+PLATFORMS = ["windows", "windows;mac", "windows;linux", "windows;mac;linux"]
+WORDS = ("game world player adventure battle explore build unique story hero enemy level dark secret "
+         "ancient city space survive craft fight puzzle mystery friends online fast classic new").split()
+
+
+# Zipf-like weights: a few genres and tags are very common and most are rare
+def zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def pick_lists(rng, vocabulary, weights, low, high, size):
+    counts = rng.integers(low, high + 1, size)
+    return [';'.join(rng.choice(vocabulary, size=min(count, len(vocabulary)), replace=False, p=weights))
+            for count in counts]
+
+
+def sentences(rng, count):
+    return ' '.join(' '.join(rng.choice(WORDS, rng.integers(6, 16))).capitalize() + '.' for _ in range(count))
+
+
+def description_html(rng):
+    paragraphs = [f"<p>{sentences(rng, rng.integers(2, 6))}</p>" for _ in range(max(1, int(rng.lognormal(1.0, 0.6))))]
+    if rng.random() < 0.5:
+        paragraphs.append(f'<img src="https://steamcdn-a.akamaihd.net/steam/apps/{rng.integers(10**6)}/extras/a.gif">')
+    if rng.random() < 0.6:
+        items = ''.join(f"<li><strong>{rng.choice(WORDS).title()}</strong> - {sentences(rng, 1)}</li>"
+                        for _ in range(rng.integers(2, 6)))
+        paragraphs.append(f'<h2 class="bb_tag">Features</h2><ul class="bb_ul">{items}</ul>')
+    return ''.join(paragraphs)
+
+
+def requirements_text(rng, system):
+    def block(label, ram, storage, gpu):
+        return (f"<strong>{label}:</strong><br><ul class=\"bb_ul\"><li><strong>OS:</strong> {system}</li>"
+                f"<li><strong>Processor:</strong> {rng.choice([1.8, 2.0, 2.4, 3.0])} GHz</li>"
+                f"<li><strong>Memory:</strong> {ram} GB RAM</li>"
+                f"<li><strong>Graphics:</strong> {gpu} MB VRAM</li>"
+                f"<li><strong>Storage:</strong> {storage} GB available space</li></ul>")
+    ram = int(rng.choice([1, 2, 4, 8, 16], p=[0.15, 0.3, 0.3, 0.2, 0.05]))
+    storage = int(rng.choice([1, 2, 5, 10, 20, 50]))
+    gpu = int(rng.choice([256, 512, 1024, 2048, 4096]))
+    text = f"{{'minimum': '{block('Minimum', ram, storage, gpu)}'"
+    if rng.random() < 0.5:
+        text += f", 'recommended': '{block('Recommended', ram * 2, storage, gpu * 2)}'"
+    return text + "}"
+
+
+def write_chunk(out_dir, rng, first_appid, size, header):
+    appids = np.arange(first_appid, first_appid + size) * 10
+    platforms = rng.choice(PLATFORMS, size, p=[0.6, 0.1, 0.1, 0.2])
+    positive = np.floor(rng.pareto(1.2, size) * 20).astype(np.int64)
+    negative = np.floor(positive * rng.beta(2, 8, size)).astype(np.int64)
+    price = np.where(rng.random(size) < 0.1, 0.0, np.round(rng.lognormal(1.8, 0.8, size).clip(0.49, 59.99), 2))
+    release = pd.to_datetime('1997-01-01') + pd.to_timedelta(rng.integers(0, 8000, size), unit='D')
+    developers = [f"Studio {i}" for i in rng.zipf(1.6, size) % 20000]
+
+    steam = pd.DataFrame({
+        'appid': appids,
+        'name': [f"{' '.join(rng.choice(WORDS, rng.integers(1, 4))).title()} {appid}" for appid in appids],
+        'release_date': release.strftime('%Y-%m-%d'),
+        'english': 1,
+        'developer': developers,
+        'publisher': developers,
+        'platforms': platforms,
+        'required_age': rng.choice([0, 0, 0, 12, 16, 18], size),
+        'categories': pick_lists(rng, CATEGORIES, zipf_weights(len(CATEGORIES), 0.8), 1, 5, size),
+        'genres': pick_lists(rng, GENRES, zipf_weights(len(GENRES)), 1, 3, size),
+        'steamspy_tags': pick_lists(rng, TAGS, zipf_weights(len(TAGS)), 1, 3, size),
+        'achievements': rng.poisson(10, size),
+        'positive_ratings': positive,
+        'negative_ratings': negative,
+        'average_playtime': rng.poisson(100, size),
+        'median_playtime': rng.poisson(50, size),
+        'owners': '0-20000',
+        'price': price,
+    })
+    descriptions = pd.DataFrame({
+        'steam_appid': appids,
+        'detailed_description': [description_html(rng) for _ in range(size)],
+        'about_the_game': '',
+        'short_description': [sentences(rng, 1) for _ in range(size)],
+    })
+    media = pd.DataFrame({
+        'steam_appid': appids,
+        'header_image': [f"https://steamcdn-a.akamaihd.net/steam/apps/{appid}/header.jpg" for appid in appids],
+        'screenshots': '[]',
+        'background': [f"https://steamcdn-a.akamaihd.net/steam/apps/{appid}/page_bg_generated_v6b.jpg"
+                       for appid in appids],
+        'movies': '',
+    })
+    requirements = pd.DataFrame({
+        'steam_appid': appids,
+        'pc_requirements': [requirements_text(rng, 'Windows 7') for _ in range(size)],
+        'mac_requirements': [requirements_text(rng, 'macOS 10.12') if 'mac' in p else '[]' for p in platforms],
+        'linux_requirements': [requirements_text(rng, 'Ubuntu 16.04') if 'linux' in p else '[]' for p in platforms],
+        'minimum': '',
+        'recommended': '',
+    })
+    support = pd.DataFrame({
+        'steam_appid': appids,
+        'website': np.where(rng.random(size) < 0.6, [f"https://example.com/{appid}" for appid in appids], ''),
+        'support_url': [f"https://support.example.com/{appid}" for appid in appids],
+        'support_email': '',
+    })
+    tag_counts = pd.DataFrame(rng.poisson(0.3, (size, len(TAGS))), columns=[tag.lower() for tag in TAGS])
+    tag_counts.insert(0, 'appid', appids)
+
+    frames = {
+        'steam.csv': steam,
+        'steam_description_data.csv': descriptions,
+        'steam_media_data.csv': media,
+        'steam_requirements_data.csv': requirements,
+        'steam_support_info.csv': support,
+        'steamspy_tag_data.csv': tag_counts,
+    }
+    for name, frame in frames.items():
+        frame.to_csv(os.path.join(out_dir, name), mode='w' if header else 'a', header=header, index=False)
+
+
+def generate_catalog(out_dir, games, chunk_size=50000, seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for start in range(0, games, chunk_size):
+        write_chunk(out_dir, rng, start + 1, min(chunk_size, games - start), header=start == 0)
+        print(f"Generated {min(start + chunk_size, games)}/{games} games")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Steam catalog")
+    parser.add_argument('out_dir')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_catalog(args.out_dir, args.games, args.chunk_size, args.seed)
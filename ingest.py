@@ -0,0 +1,637 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pymongo
+from bs4 import BeautifulSoup
+from pymongo import ReplaceOne
+from scipy import sparse
+
+import main
+
+
+# Loads the Kaggle CSVs into Mongo and keeps the similarity index built. The data libraries live here
+# so that the API workers, which only import main.py, start without them:
+#   python ingest.py                  loads the CSVs, or syncs them once the games collection exists
+#   python ingest.py sync [data_dir] [--batch-size N] [--workers N] [--memory-budget MB]
+#   python ingest.py rebuild-similarity [k]
+
+INGEST_BATCH_SIZE = 5000
+HTML_CLEAN_WORKERS = os.cpu_count() or 1
+HTML_CLEAN_CHUNK_SIZE = 500
+HTML_CACHE_PATH = 'html_cache.sqlite'
+# steam.csv and companion CSVs are read in chunks that start at INGEST_CHUNK_ROWS rows and shrink
+# or grow within the bounds below to keep the process under INGEST_MEMORY_BUDGET_MB (0 disables)
+INGEST_CHUNK_ROWS = 20000
+INGEST_MIN_CHUNK_ROWS = 500
+INGEST_MAX_CHUNK_ROWS = 200000
+INGEST_MEMORY_BUDGET_MB = int(os.environ.get("INGEST_MEMORY_BUDGET_MB", 2048))
+INGEST_LOOKUP_PATH = 'ingest_lookup.sqlite'
+MARKUP = re.compile(r'[<&]')
+
+GAME_COLUMNS = [
+    "_id", "name", "release_date", "developer", "platforms", "categories", "genres", "tags",
+    "positive_ratings", "negative_ratings", "price", "website", "support_url", "header_img",
+    "background_img", "detailed_description", "linux_requirements", "windows_requirements", "mac_requirements",
+    "release_year", "name_lower", "system_requirements", "wilson_score", "source_hash"
+]
+
+STEAM_COLUMNS = {
+    'appid': 'int64', 'name': 'str', 'release_date': 'str', 'developer': 'str', 'platforms': 'str',
+    'categories': 'str', 'genres': 'str', 'steamspy_tags': 'str', 'positive_ratings': 'int64',
+    'negative_ratings': 'int64', 'price': 'float64',
+}
+
+
+# Fields read back from Mongo by sync_steam_db to compare hashes and update the reports, leaderboards
+# and similarity index
+SYNC_PROJECTION = dict(main.LEADERBOARD_FIELDS, source_hash=1, price=1)
+SYNC_COUNTS = ["inserted", "updated", "deleted", "unchanged"]
+# Share of the catalog that may change its genres/tags before the similarity index is rebuilt instead of patched
+SYNC_SIMILARITY_REBUILD_RATIO = 0.05
+
+REQUIREMENT_COLUMNS = {
+    'pc_requirements': 'windows_requirements',
+    'mac_requirements': 'mac_requirements',
+    'linux_requirements': 'linux_requirements',
+}
+
+MISSING_DATA_FIELDS = [
+    "website", "support_url", "header_img", "background_img",
+    "linux_requirements", "windows_requirements", "mac_requirements"
+]
+
+
+# The character-level passes of clean_from_tags folded into one compiled pattern:
+# real and escaped newlines/tabs are dropped, quotes and braces become spaces
+TAG_CHARACTERS = re.compile(r"[\n\t\r]|\\[ntr]|['{}]")
+MINIMUM_LABEL = re.compile(r' minimum: ')
+WHITESPACE = re.compile(r'\s+')
+
+
+def replace_tag_character(match):
+    return ' ' if match.group() in "'{}" else ''
+
+
+def clean_from_tags(cleaned_string):
+
+    cleaned_string = TAG_CHARACTERS.sub(replace_tag_character, cleaned_string)
+    # count=0 means "replace all" for re.sub, so a single label is dropped and a missing one is kept as is
+    repeated_minimums = cleaned_string.count("minimum:") - 1
+    if repeated_minimums >= 0:
+        cleaned_string = MINIMUM_LABEL.sub(' ', cleaned_string, count=repeated_minimums)
+    cleaned_string = WHITESPACE.sub(' ', cleaned_string.strip())
+    return cleaned_string
+
+
+GAME_FIELD_DEFAULTS = {
+    "name": "Unknown Game",
+    "release_date": "Unknown Date",
+    "developer": "Unknown Developer",
+    "platforms": [],
+    "categories": [],
+    "genres": [],
+    "tags": [],
+    "positive_ratings": 0,
+    "negative_ratings": 0,
+    "price": 0.0,
+    "detailed_description": "No description available",
+}
+
+
+def clean_game_document(game):
+    for key, default in GAME_FIELD_DEFAULTS.items():
+        if key in game:
+            value = game[key]
+            if isinstance(value, (list, np.ndarray, pd.Series)):
+                if len(value) == 0:
+                    game[key] = default
+            elif pd.isna(value):
+                game[key] = default
+        else:
+            game[key] = default
+    return game
+
+
+# Column-wise version of clean_game_document for a whole frame of games
+def clean_game_frame(games):
+    for key, default in GAME_FIELD_DEFAULTS.items():
+        if key not in games:
+            games[key] = [list(default) if isinstance(default, list) else default for _ in range(len(games))]
+            continue
+        if isinstance(default, list):
+            column = games[key]
+            games[key] = [v if isinstance(v, list) and len(v) > 0 else [] for v in column]
+        else:
+            games[key] = games[key].fillna(default)
+    return games
+
+
+# Reads a CSV in chunks of the listed columns only. With a memory budget the chunk size is halved
+# whenever the process goes over 80% of it and doubled again while it stays under half.
+def read_csv_chunks(path, dtype, chunk_size=INGEST_CHUNK_ROWS, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    with pd.read_csv(path, usecols=list(dtype), dtype=dtype, iterator=True) as reader:
+        while True:
+            try:
+                chunk = reader.get_chunk(chunk_size)
+            except StopIteration:
+                return
+            yield chunk
+            if memory_budget_mb:
+                rss = current_rss_mb()
+                if rss > 0.8 * memory_budget_mb:
+                    chunk_size = max(INGEST_MIN_CHUNK_ROWS, chunk_size // 2)
+                elif rss < 0.5 * memory_budget_mb:
+                    chunk_size = min(INGEST_MAX_CHUNK_ROWS, chunk_size * 2)
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb(children=False):
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def description_fields(chunk, workers, html_cache):
+    return {'detailed_description': clean_html_column(chunk['detailed_description'].tolist(), 'description',
+                                                      workers, html_cache)}
+
+
+def requirement_fields(chunk, workers, html_cache):
+    texts = clean_html_column([v for column in REQUIREMENT_COLUMNS for v in chunk[column].tolist()], 'requirements',
+                              workers, html_cache)
+    return {field: texts[i * len(chunk):(i + 1) * len(chunk)] for i, field in enumerate(REQUIREMENT_COLUMNS.values())}
+
+
+def support_fields(chunk, workers, html_cache):
+    return {'website': chunk['website'].tolist(), 'support_url': chunk['support_url'].tolist()}
+
+
+def media_fields(chunk, workers, html_cache):
+    return {'header_img': chunk['header_image'].tolist(), 'background_img': chunk['background'].tolist()}
+
+
+# Companion CSV -> (lookup table, columns read, game fields, whether the first or last row of an appid wins,
+# function turning a chunk into the game fields)
+COMPANION_SOURCES = {
+    'steam_description_data.csv': ('descriptions', {'steam_appid': 'int64', 'detailed_description': 'str'},
+                                   ['detailed_description'], 'first', description_fields),
+    'steam_requirements_data.csv': ('requirements', dict({'steam_appid': 'int64'}, **dict.fromkeys(REQUIREMENT_COLUMNS, 'str')),
+                                    list(REQUIREMENT_COLUMNS.values()), 'last', requirement_fields),
+    'steam_support_info.csv': ('support', {'steam_appid': 'int64', 'website': 'str', 'support_url': 'str'},
+                               ['website', 'support_url'], 'last', support_fields),
+    'steam_media_data.csv': ('media', {'steam_appid': 'int64', 'header_image': 'str', 'background': 'str'},
+                             ['header_img', 'background_img'], 'last', media_fields),
+}
+
+
+# Cleans the companion CSVs chunk by chunk into an on-disk sqlite table per file keyed by appid,
+# so that only the chunk being cleaned and the steam.csv chunk being joined are ever in memory
+def stage_companions(data_dir, stats, workers=HTML_CLEAN_WORKERS, html_cache=HTML_CACHE_PATH,
+                     memory_budget_mb=INGEST_MEMORY_BUDGET_MB, path=INGEST_LOOKUP_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+    lookup = sqlite3.connect(path)
+    for source, (table, dtype, fields, keep, transform) in COMPANION_SOURCES.items():
+        lookup.execute(f"CREATE TABLE {table} (appid INTEGER PRIMARY KEY, {', '.join(f'{f} TEXT' for f in fields)})")
+        insert = (f"INSERT OR {'IGNORE' if keep == 'first' else 'REPLACE'} INTO {table} "
+                  f"VALUES ({', '.join('?' * (len(fields) + 1))})")
+        for chunk in read_csv_chunks(os.path.join(data_dir, source), dtype, memory_budget_mb=memory_budget_mb):
+            started = time.perf_counter()
+            values = transform(chunk, workers, html_cache)
+            rows = zip(chunk['steam_appid'].tolist(), *(values[field] for field in fields))
+            with lookup:
+                lookup.executemany(insert, ([None if pd.isna(v) else v for v in row] for row in rows))
+            record_stage(stats, f"stage {source}", len(chunk), started)
+    return lookup
+
+
+def close_companion_lookup(lookup, path=INGEST_LOOKUP_PATH):
+    lookup.close()
+    os.remove(path)
+
+
+def companion_rows(lookup, table, fields, ids):
+    rows = []
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        rows += lookup.execute(f"SELECT * FROM {table} WHERE appid IN ({','.join('?' * len(batch))})", batch).fetchall()
+    return pd.DataFrame(rows, columns=['_id'] + fields).astype({'_id': 'int64'})
+
+
+# Joins steam.csv chunk by chunk with the staged companion tables and yields the game frames
+def iter_game_frames(data_dir, lookup, stats, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    for chunk in read_csv_chunks(os.path.join(data_dir, 'steam.csv'), STEAM_COLUMNS,
+                                 memory_budget_mb=memory_budget_mb):
+        started = time.perf_counter()
+        games = build_games_frame(chunk, lookup)
+        record_stage(stats, "join and transform", len(games), started)
+        yield games
+
+
+def create_steam_db(data_dir='.', batch_size=INGEST_BATCH_SIZE, workers=HTML_CLEAN_WORKERS,
+                    html_cache=HTML_CACHE_PATH, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    stats = []
+    lookup = stage_companions(data_dir, stats, workers, html_cache, memory_budget_mb)
+
+    col_games = main.database.create_collection("games", validator=main.games_validator)
+
+    games = 0
+    for frame in iter_game_frames(data_dir, lookup, stats, memory_budget_mb):
+        started = time.perf_counter()
+        insert_games(col_games, frame, batch_size)
+        record_stage(stats, "insert_many", len(frame), started)
+        games += len(frame)
+    close_companion_lookup(lookup)
+
+    started = time.perf_counter()
+    main.ensure_indexes()
+    record_stage(stats, "create indexes", games, started)
+
+    started = time.perf_counter()
+    main.rebuild_reports()
+    record_stage(stats, "materialize reports", games, started)
+
+    started = time.perf_counter()
+    main.rebuild_leaderboards()
+    record_stage(stats, "leaderboards", games, started)
+
+    started = time.perf_counter()
+    build_similarity_index()
+    record_stage(stats, "similarity index", games, started)
+
+    print_ingest_report(stats)
+
+
+# Size and modification time of the files ingest reads, steam.csv and the companion CSVs; a checkpoint
+# is only resumed against the same files
+def source_fingerprint(data_dir):
+    fingerprint = []
+    for source in ['steam.csv'] + list(COMPANION_SOURCES):
+        path = os.path.join(data_dir, source)
+        fingerprint.append([source, os.path.getsize(path), int(os.path.getmtime(path))])
+    return fingerprint
+
+
+# Brings an existing games collection in line with the CSVs. Games whose source_hash differs from
+# the one stored are replaced, new ones inserted and ingested games missing from the source deleted;
+# games added through the API have no source_hash and are left alone. The batch position and counts
+# are checkpointed in ingest_checkpoints, so an interrupted run resumes after the last steam.csv row it wrote.
+def sync_steam_db(data_dir='.', batch_size=INGEST_BATCH_SIZE, workers=HTML_CLEAN_WORKERS,
+                  html_cache=HTML_CACHE_PATH, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    stats = []
+    fingerprint = source_fingerprint(data_dir)
+    checkpoint = main.database.ingest_checkpoints.find_one({"_id": "sync"})
+    resumed = checkpoint is not None and checkpoint["fingerprint"] == fingerprint
+    if resumed:
+        print(f"Resuming sync after row {checkpoint['rows']}")
+    else:
+        checkpoint = {"_id": "sync", "fingerprint": fingerprint, "rows": 0,
+                      "counts": dict.fromkeys(SYNC_COUNTS, 0)}
+        main.database.ingest_checkpoints.replace_one({"_id": "sync"}, checkpoint, upsert=True)
+    counts = checkpoint["counts"]
+
+    lookup = stage_companions(data_dir, stats, workers, html_cache, memory_budget_mb)
+    rows = 0
+    id_chunks = []
+    retagged = []
+    for frame in iter_game_frames(data_dir, lookup, stats, memory_budget_mb):
+        id_chunks.append(frame['_id'].to_numpy())
+        started = time.perf_counter()
+        for start in range(max(0, checkpoint["rows"] - rows), len(frame), batch_size):
+            batch = frame.iloc[start:start + batch_size].to_dict('records')
+            ids = [game["_id"] for game in batch]
+            stored = {game["_id"]: game for game in main.database.games.find({"_id": {"$in": ids}}, SYNC_PROJECTION)}
+
+            writes, removed, added = [], [], []
+            for game in batch:
+                old = stored.get(game["_id"])
+                if old is not None and old.get("source_hash") == game["source_hash"]:
+                    counts["unchanged"] += 1
+                    continue
+                writes.append(ReplaceOne({"_id": game["_id"]}, game, upsert=True))
+                added.append(game)
+                if old is None:
+                    counts["inserted"] += 1
+                    retagged.append(game["_id"])
+                else:
+                    counts["updated"] += 1
+                    removed.append(old)
+                    if old.get("genres") != game["genres"] or old.get("tags") != game["tags"]:
+                        retagged.append(game["_id"])
+            if writes:
+                main.database.games.bulk_write(writes, ordered=False)
+                main.update_reports(removed, added)
+                main.update_leaderboards(removed, added)
+            main.database.ingest_checkpoints.update_one(
+                {"_id": "sync"}, {"$set": {"rows": rows + start + len(batch), "counts": counts}})
+        rows += len(frame)
+        record_stage(stats, "upsert changed games", len(frame), started)
+    close_companion_lookup(lookup)
+    source_ids = np.sort(np.concatenate(id_chunks)) if id_chunks else np.array([], dtype='int64')
+
+    started = time.perf_counter()
+    stale = []
+    cursor = main.database.games.find({"source_hash": {"$exists": True}}, {"_id": 1})
+    while True:
+        ids = np.array([game["_id"] for game in itertools.islice(cursor, batch_size)])
+        if not len(ids):
+            break
+        stale += ids[~np.isin(ids, source_ids)].tolist()
+    for start in range(0, len(stale), batch_size):
+        ids = stale[start:start + batch_size]
+        removed = list(main.database.games.find({"_id": {"$in": ids}}, SYNC_PROJECTION))
+        main.database.games.delete_many({"_id": {"$in": ids}})
+        main.update_reports(removed=removed)
+        main.update_leaderboards(removed=removed)
+        counts["deleted"] += len(removed)
+        main.database.ingest_checkpoints.update_one({"_id": "sync"}, {"$set": {"counts": counts}})
+    record_stage(stats, "delete removed games", len(stale), started)
+
+    started = time.perf_counter()
+    main.ensure_indexes()
+    # A crash between a batch write and its report, leaderboard and similarity updates leaves them
+    # behind the games collection, so a resumed run recomputes them
+    if resumed:
+        main.rebuild_reports()
+        main.rebuild_leaderboards()
+    if (resumed or main.database.similarity_meta.find_one({"_id": "idf"}) is None
+            or len(retagged) + len(stale) > SYNC_SIMILARITY_REBUILD_RATIO * len(source_ids)):
+        build_similarity_index()
+    else:
+        main.update_similarity(retagged)
+        main.remove_from_similarity(stale)
+    record_stage(stats, "reports and similarity", len(retagged) + len(stale), started)
+
+    main.database.ingest_checkpoints.delete_one({"_id": "sync"})
+    print_ingest_report(stats)
+    print(", ".join(f"{counts[name]} {name}" for name in SYNC_COUNTS))
+    return counts
+
+
+def html_to_text(value):
+    # Plain text comes back from the parser unchanged, except whitespace-only strings which become ''
+    if not MARKUP.search(value) and value.strip():
+        return value
+    return BeautifulSoup(value, 'html.parser').get_text()
+
+
+def clean_html_value(value, mode):
+    if mode == 'requirements':
+        return clean_from_tags(html_to_text(value.lower()))
+    return html_to_text(value)
+
+
+def clean_html_chunk(values, mode):
+    return [clean_html_value(value, mode) for value in values]
+
+
+def html_cache_key(value, mode):
+    return hashlib.blake2b(f"{mode}\0{value}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def open_html_cache(path):
+    cache = sqlite3.connect(path)
+    cache.execute("CREATE TABLE IF NOT EXISTS html_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+    return cache
+
+
+# Cleans a column of raw HTML strings. Identical strings are cleaned once, strings already
+# in the on-disk cache are not parsed again and the rest are split in chunks across a process pool.
+def clean_html_column(values, mode, workers=HTML_CLEAN_WORKERS, html_cache=HTML_CACHE_PATH,
+                      chunk_size=HTML_CLEAN_CHUNK_SIZE):
+    positions = {}
+    for i, value in enumerate(values):
+        if not pd.isna(value):
+            value = str(value)
+            positions.setdefault((html_cache_key(value, mode), value), []).append(i)
+
+    cache = open_html_cache(html_cache)
+    cleaned = {}
+    keys = [key for key, _ in positions]
+    for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        rows = cache.execute(f"SELECT key, text FROM html_cache WHERE key IN ({','.join('?' * len(batch))})", batch)
+        cleaned.update(rows)
+
+    missing = [(key, value) for key, value in positions if key not in cleaned]
+    chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            texts = pool.map(clean_html_chunk, [[value for _, value in chunk] for chunk in chunks],
+                             [mode] * len(chunks))
+            parsed = [text for chunk_texts in texts for text in chunk_texts]
+    else:
+        parsed = clean_html_chunk([value for _, value in missing], mode)
+
+    new_entries = [(key, text) for (key, _), text in zip(missing, parsed)]
+    cleaned.update(new_entries)
+    with cache:
+        cache.executemany("INSERT OR REPLACE INTO html_cache (key, text) VALUES (?, ?)", new_entries)
+    cache.close()
+    print(f"html cleaning ({mode}): {len(positions) - len(missing)} cached, {len(missing)} parsed")
+
+    results = [None] * len(values)
+    for (key, _), indexes in positions.items():
+        for i in indexes:
+            results[i] = cleaned[key]
+    return results
+
+
+def split_list_column(column):
+    return column.str.split(';')
+
+
+def build_games_frame(s, lookup):
+    games = pd.DataFrame({
+        '_id': s['appid'].to_numpy(),
+        'name': s['name'].to_numpy(),
+        'release_date': s['release_date'].to_numpy(),
+        'developer': s['developer'].to_numpy(),
+        'platforms': split_list_column(s['platforms']).to_numpy(),
+        'categories': split_list_column(s['categories']).to_numpy(),
+        'genres': split_list_column(s['genres']).to_numpy(),
+        'tags': split_list_column(s['steamspy_tags']).to_numpy(),
+        'positive_ratings': s['positive_ratings'].to_numpy(),
+        'negative_ratings': s['negative_ratings'].to_numpy(),
+        'price': s['price'].to_numpy(),
+    })
+
+    ids = games['_id'].tolist()
+    for table, _, fields, _, _ in COMPANION_SOURCES.values():
+        games = games.merge(companion_rows(lookup, table, fields, ids), on='_id', how='left')
+
+    for field in MISSING_DATA_FIELDS:
+        games[field] = games[field].fillna('No Data Available').astype(str)
+        games.loc[games[field].isin(['nan', '[]']), field] = 'No Data Available'
+
+    games = clean_game_frame(games)
+    games['positive_ratings'] = games['positive_ratings'].astype('int64')
+    games['negative_ratings'] = games['negative_ratings'].astype('int64')
+    games['price'] = games['price'].astype('float64')
+    years = games['release_date'].str.extract(r'(\d{4})', expand=False)
+    # An object column: assigned as a list, one missing year turns the chunk's years into floats and NaN
+    games['release_year'] = pd.Series([int(year) if isinstance(year, str) else None for year in years],
+                                      index=games.index, dtype=object)
+    games['name_lower'] = games['name'].astype(str).str.lower()
+    games['system_requirements'] = [main.parse_system_requirements(game) for game in
+                                    games[list(main.REQUIREMENT_SYSTEMS.values())].to_dict('records')]
+    games['wilson_score'] = [main.wilson_score(positive, negative) for positive, negative in
+                             zip(games['positive_ratings'].tolist(), games['negative_ratings'].tolist())]
+    games['source_hash'] = row_hashes(games)
+    return games[GAME_COLUMNS]
+
+
+# Hash of every field of each merged game, compared by sync_steam_db with the hash stored in Mongo
+def row_hashes(games):
+    columns = [column for column in GAME_COLUMNS if column not in ("_id", "source_hash")]
+    return [hashlib.blake2b(json.dumps(row, default=str).encode('utf-8'), digest_size=16).hexdigest()
+            for row in games[columns].itertuples(index=False, name=None)]
+
+
+def insert_games(collection, games, batch_size=INGEST_BATCH_SIZE):
+    for start in range(0, len(games), batch_size):
+        batch = games.iloc[start:start + batch_size].to_dict('records')
+        collection.insert_many(batch, ordered=False)
+
+
+# Adds a timed stage to the ingest report; stages run once per chunk are summed into one line
+def record_stage(stats, stage, rows, started):
+    elapsed = time.perf_counter() - started
+    for i, (name, total, seconds) in enumerate(stats):
+        if name == stage:
+            stats[i] = (name, total + rows, seconds + elapsed)
+            return
+    stats.append((stage, rows, elapsed))
+
+
+def print_ingest_report(stats):
+    print(f"{'stage':<36}{'rows':>12}{'seconds':>10}{'rows/sec':>14}")
+    for stage, rows, elapsed in stats:
+        rate = rows / elapsed if elapsed > 0 else float('inf')
+        print(f"{stage:<36}{rows:>12}{elapsed:>10.2f}{rate:>14.0f}")
+    print(f"peak RSS {peak_rss_mb():.0f} MB, html cleaning workers {peak_rss_mb(children=True):.0f} MB")
+
+
+# Builds the top-k neighbour lists of every game from a sparse TF-IDF matrix of genres and tags
+def build_similarity_index(k=main.SIMILARITY_TOP_K, chunk_size=main.SIMILARITY_CHUNK_SIZE):
+    games = list(main.database.games.find({}, {"_id": 1, "genres": 1, "tags": 1}))
+    # A plain list: games added through the API may have an ObjectId _id
+    ids = [game["_id"] for game in games]
+    token_sets = [main.game_tokens(game) for game in games]
+
+    document_frequency = {}
+    for tokens in token_sets:
+        for token in tokens:
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+    idf = {token: math.log((1 + len(games)) / (1 + count)) + 1 for token, count in document_frequency.items()}
+    columns = {token: i for i, token in enumerate(idf)}
+
+    rows, cols, weights = [], [], []
+    for row, tokens in enumerate(token_sets):
+        for token in tokens:
+            rows.append(row)
+            cols.append(columns[token])
+            weights.append(idf[token])
+    matrix = sparse.csr_matrix((weights, (rows, cols)), shape=(len(games), len(columns)))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms) @ matrix
+    transposed = matrix.T.tocsc()
+
+    rebuilt = main.database.similar_games_rebuild
+    rebuilt.drop()
+    for start in range(0, len(games), chunk_size):
+        scores = (matrix[start:start + chunk_size] @ transposed).tocsr()
+        documents = []
+        for row in range(scores.shape[0]):
+            begin, end = scores.indptr[row], scores.indptr[row + 1]
+            neighbours, values = scores.indices[begin:end], scores.data[begin:end]
+            keep = neighbours != start + row
+            neighbours, values = neighbours[keep], values[keep]
+            if len(values) > k:
+                top = np.argpartition(-values, k)[:k]
+                neighbours, values = neighbours[top], values[top]
+            order = np.argsort(-values, kind='stable')
+            documents.append(main.similarity_document(
+                ids[start + row], [(ids[n], float(v)) for n, v in zip(neighbours[order], values[order])], k))
+        if documents:
+            rebuilt.insert_many(documents, ordered=False)
+
+    if len(games):
+        rebuilt.rename("similar_games", dropTarget=True)
+    main.database.similar_games.create_index([("neighbours._id", pymongo.ASCENDING)], name="neighbours_id")
+    main.database.similarity_meta.replace_one(
+        {"_id": "idf"},
+        {"idf": sorted(idf.items()), "default_idf": max(idf.values(), default=1.0), "games": len(games), "k": k},
+        upsert=True)
+    print(f"Built similarity index for {len(games)} games over {len(columns)} genres and tags")
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+
+def run(argv):
+    parser = argparse.ArgumentParser(description="Load the Kaggle CSVs into Mongo and keep the similarity index built. "
+                                                 "Without a command, loads or syncs the current directory.")
+    commands = parser.add_subparsers(dest='command')
+    for name, help in (('load', "insert every game of the CSVs"),
+                       ('sync', "replace, insert and delete only the games whose CSV rows changed")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('data_dir', nargs='?', default='.')
+        command.add_argument('--batch-size', type=positive_int, default=INGEST_BATCH_SIZE)
+        command.add_argument('--workers', type=positive_int, default=HTML_CLEAN_WORKERS)
+        command.add_argument('--html-cache', default=HTML_CACHE_PATH)
+        command.add_argument('--memory-budget', type=non_negative_int, default=INGEST_MEMORY_BUDGET_MB,
+                             help="MB to keep the process under, 0 disables")
+    similarity = commands.add_parser('rebuild-similarity', help="score every pair of games again")
+    similarity.add_argument('k', nargs='?', type=positive_int, default=main.SIMILARITY_TOP_K,
+                            help="neighbours stored per game")
+    similarity.add_argument('--chunk-size', type=positive_int, default=main.SIMILARITY_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild-similarity':
+        build_similarity_index(k=args.k, chunk_size=args.chunk_size)
+        return
+    if args.command is None:
+        load = "games" not in main.database.list_collection_names()
+        args = parser.parse_args(['load' if load else 'sync'])
+    command = create_steam_db if args.command == 'load' else sync_steam_db
+    command(args.data_dir, batch_size=args.batch_size, workers=args.workers, html_cache=args.html_cache,
+            memory_budget_mb=args.memory_budget)
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
@@ -1,122 +1,1677 @@
 import pymongo
-import pandas as pd
+from pymongo import DeleteOne, IndexModel, InsertOne, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.collation import Collation
 import re
-from datetime import datetime
-import numpy as np
-from django.contrib.admin import display
-import ast
-from bs4 import BeautifulSoup
-from flask import Flask, request, jsonify,Response
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify,Response, make_response, g, redirect, send_file
+from flask.json.provider import DefaultJSONProvider
+from bson import Decimal128, ObjectId, json_util
+from bson.errors import BSONError
 import csv
+import math
+import base64
+import json
+import io
+import itertools
+import zlib
+import os
+import sys
+import time
+import hashlib
+import functools
+import threading
+import queue
+import heapq
+from collections import OrderedDict
+
+# Optional: orjson speeds up JSON encoding and brotli adds 'br' to the negotiated encodings
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.environ.get("MONGO_DB", "steam")
+
+
+# Connection pool settings shared by the Flask and the ASGI server
+def mongo_client_options():
+    return {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000)),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 20000)),
+        "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 0)) or None,
+        "readPreference": os.environ.get("MONGO_READ_PREFERENCE", "primary"),
+    }
+
 
+# Latency buckets in seconds and response-size buckets in bytes of the /metrics histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MONITORED_COMMANDS = {"find", "aggregate", "update", "delete", "insert", "findAndModify", "count", "distinct"}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "update", "delete", "findAndModify", "count", "distinct"}
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{metric_labels(key, le=bound)} {count}")
+                lines.append(f"{self.name}_bucket{metric_labels(key, le='+Inf')} {series['count']}")
+                lines.append(f"{self.name}_sum{metric_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{metric_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{metric_labels(key)} {value}" for key, value in sorted(self.series.items())]
+        return lines
+
+
+def metric_labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+request_latency = Histogram("http_request_duration_seconds", "Latency of each route.", LATENCY_BUCKETS)
+response_size = Histogram("http_response_size_bytes", "Size of the response bodies of each route.", SIZE_BUCKETS)
+request_errors = Counter("http_request_errors_total", "Responses with a 4xx or 5xx status per route.")
+command_latency = Histogram("mongo_command_duration_seconds",
+                            "Latency of the Mongo commands by collection and query or pipeline shape.", LATENCY_BUCKETS)
+command_failures = Counter("mongo_command_failures_total", "Failed Mongo commands by collection and shape.")
+slow_queries = Counter("mongo_slow_queries_total", "Mongo commands slower than SLOW_QUERY_MS.")
+METRICS = [request_latency, response_size, request_errors, command_latency, command_failures, slow_queries]
+
+
+def record_request(route, method, status, seconds, size=None):
+    labels = {"route": route, "method": method}
+    request_latency.observe(labels, seconds)
+    if size is not None:
+        response_size.observe(labels, size)
+    if status >= 400:
+        request_errors.inc(dict(labels, status=status))
+
+
+def render_metrics():
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+# Field names of a filter, without the values, so that queries on the same fields share a series
+def filter_shape(query):
+    fields = set()
+    for key, value in (query or {}).items():
+        if key in ("$and", "$or", "$nor") and isinstance(value, list):
+            fields.update(field for clause in value for field in filter_shape(clause).split(",") if field)
+        elif not key.startswith("$"):
+            fields.add(key)
+    return ",".join(sorted(fields))
+
+
+def command_shape(name, command):
+    if name == "aggregate":
+        return ">".join(next(iter(stage)) for stage in command.get("pipeline", []) if stage)
+    if name == "find":
+        shape = "filter:" + filter_shape(command.get("filter"))
+        if command.get("sort"):
+            shape += " sort:" + ",".join(command["sort"])
+        return shape
+    if name == "update":
+        return "filter:" + filter_shape((command.get("updates") or [{}])[0].get("q"))
+    if name == "delete":
+        return "filter:" + filter_shape((command.get("deletes") or [{}])[0].get("q"))
+    if name in ("findAndModify", "count", "distinct"):
+        return "filter:" + filter_shape(command.get("query"))
+    return ""
+
+
+# Times the commands of MONITORED_COMMANDS and hands those over SLOW_QUERY_MS to the slow-query log.
+# The explain commands of the log are not in MONITORED_COMMANDS, so they never explain themselves.
+class QueryMonitor(monitoring.CommandListener):
+    def __init__(self):
+        self.pending = {}
+        self.slow_log = None
+
+    def started(self, event):
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        self.pending[(event.connection_id, event.request_id)] = (
+            {"command": event.command_name, "collection": collection,
+             "shape": command_shape(event.command_name, event.command)},
+            event.command if event.command_name in EXPLAINABLE_COMMANDS else None, event.database_name)
+
+    def succeeded(self, event):
+        pending = self.pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        labels, command, database_name = pending
+        command_latency.observe(labels, event.duration_micros / 1e6)
+        if SLOW_QUERY_MS and event.duration_micros / 1000 >= SLOW_QUERY_MS:
+            slow_queries.inc(labels)
+            if command is not None:
+                self.log_slow_query(database_name, command, event.duration_micros / 1000)
+
+    def failed(self, event):
+        pending = self.pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            command_failures.inc(pending[0])
+
+    # Explaining runs on a background thread so that the slow request is not made slower
+    def log_slow_query(self, database_name, command, milliseconds):
+        if self.slow_log is None:
+            self.slow_log = queue.Queue(maxsize=100)
+            threading.Thread(target=self.explain_slow_queries, daemon=True).start()
+        try:
+            self.slow_log.put_nowait((database_name, command, milliseconds))
+        except queue.Full:
+            pass
+
+    def explain_slow_queries(self):
+        while True:
+            database_name, command, milliseconds = self.slow_log.get()
+            command = {key: value for key, value in command.items()
+                       if not key.startswith("$") and key not in ("lsid", "txnNumber")}
+            entry = {"time": datetime.now(timezone.utc).isoformat(), "milliseconds": milliseconds,
+                     "command": command}
+            try:
+                explain = conn[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+                entry["winning_plan"] = explain.get("queryPlanner", {}).get("winningPlan")
+            except Exception as e:
+                entry["explain_error"] = str(e)
+            with open(SLOW_QUERY_LOG, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+
+query_monitor = QueryMonitor()
+
+
+# BSON values the JSON encoders do not know; everything else falls back to Flask's encoder
+def bson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    return DefaultJSONProvider.default(value)
+
+
+# Flask's JSON provider with orjson doing the encoding when it is installed. Keys stay sorted and
+# datetimes are passed to Flask's encoder, so the output is the one jsonify produced before.
+class FastJSONProvider(DefaultJSONProvider):
+    def encode(self, obj, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=bson_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault("default", bson_default)
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj, bool(kwargs.get("indent"))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.encode(obj, indent) + b"\n", mimetype=self.mimetype)
 
 
 app = Flask(__name__)
-conn = pymongo.MongoClient("mongodb://localhost:27017/")
-database = conn['steam']
+app.json = FastJSONProvider(app)
+conn = pymongo.MongoClient(MONGO_URI, event_listeners=[query_monitor], **mongo_client_options())
+database = conn[MONGO_DB]
+
+RELEASE_YEAR = re.compile(r'\d{4}')
+
+# Case-insensitive string comparison; lookups must pass the same collation as the name/developer indexes
+CASE_INSENSITIVE = Collation(locale='en', strength=2)
+CASE_INSENSITIVE_FIELDS = ["name", "developer"]
+
+games_validator = \
+    {
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": [
+                "name",
+                "release_date",
+                "developer",
+                "platforms",
+                "categories",
+                "genres",
+                "tags",
+                "positive_ratings",
+                "negative_ratings",
+                "price",
+                "website",
+                "support_url",
+                "header_img",
+                "background_img",
+                "detailed_description",
+                "linux_requirements",
+                "windows_requirements",
+                "mac_requirements"
+            ],
+            "properties": {
+                "name": {
+                    "bsonType": "string",
+                    "description": "The name of the game."
+                },
+                "release_date": {
+                    "bsonType": "string",
+                    "description": "The release date of the game in string format."
+                },
+                "developer": {
+                    "bsonType": "string",
+                    "description": "The developer of the game."
+                },
+                "platforms": {
+                    "bsonType": "array",
+                    "items": {
+                        "bsonType": "string"
+                    },
+                    "description": "The platforms the game is available on (e.g., Windows, Mac, Linux)."
+                },
+                "categories": {
+                    "bsonType": "array",
+                    "items": {
+                        "bsonType": "string"
+                    },
+                    "description": "The categories of the game."
+                },
+                "genres": {
+                    "bsonType": "array",
+                    "items": {
+                        "bsonType": "string"
+                    },
+                    "description": "The genres of the game."
+                },
+                "tags": {
+                    "bsonType": "array",
+                    "items": {
+                        "bsonType": "string"
+                    },
+                    "description": "Tags associated with the game."
+                },
+                "positive_ratings": {
+                    "bsonType": "int",
+                    "minimum": 0,
+                    "description": "The number of positive ratings for the game."
+                },
+                "negative_ratings": {
+                    "bsonType": "int",
+                    "minimum": 0,
+                    "description": "The number of negative ratings for the game."
+                },
+                "price": {
+                    "bsonType": "double",
+                    "minimum": 0,
+                    "description": "The price of the game."
+                },
+                "website": {
+                    "bsonType": "string",
+                    "description": "Url of the website about the game"
+                },
+                "support_url": {
+                    "bsonType": "string",
+                    "description": "Url to the steam support page"
+                },
+                "header_img": {
+                    "bsonType": "string",
+                    "description": "Url to the header image of the game."
+                },
+                "background_img": {
+                    "bsonType": "string",
+                    "description": "Url to the background image of the game."
+                },
+                "detailed_description": {
+                    "bsonType": "string",
+                    "description": "Detailed description of the game."
+                },
+                "linux_requirements": {
+                    "bsonType": "string",
+                    "description": "Linux system requirements for the game."
+                },
+                "windows_requirements": {
+                    "bsonType": "string",
+                    "description": "Windows system requirements for the game."
+                },
+                "mac_requirements": {
+                    "bsonType": "string",
+                    "description": "Mac system requirements for the game."
+                }
+            }
+        }
+    }
+
+
+GAMES_FILTER_FIELDS = ["name", "release_date", "developer", "platforms", "categories", "genres", "tags",
+                       "positive_ratings", "negative_ratings", "price"]
+GAMES_RANGE_FILTERS = {
+    "min_price": ("price", "$gte"),
+    "max_price": ("price", "$lte"),
+    "min_ratings": ("positive_ratings", "$gte"),
+}
+GAMES_SORT_FIELDS = ["_id", "name", "release_date", "price", "positive_ratings"]
+RESPONSE_ARGS = ["fields"]
+GAMES_FACET_FIELDS = ["genres", "tags", "platforms"]
+GAMES_FACET_SIZE = 20
+# Lower bounds of the price facet buckets; the last one collects every price from there up
+PRICE_FACET_BOUNDARIES = [0, 0.01, 5, 10, 20, 40]
+RATING_FACET_BUCKETS = 10
+GAMES_PAGE_SIZE = 50
+GAMES_MAX_PAGE_SIZE = 500
+PAGINATION_ARGS = ["after", "limit", "sort"]
+GAMES_PROJECTION = {"_id": 0, "name": 1, "price": 1, "genres": 1, "positive_ratings": 1}
+
+
+# Converts a query-string value to the bsonType the games validator declares for the field
+def coerce_field(field, value):
+    schema = games_validator["$jsonSchema"]["properties"][field]
+    bson_type = schema["items"]["bsonType"] if schema["bsonType"] == "array" else schema["bsonType"]
+    try:
+        if bson_type == "int":
+            return int(value)
+        if bson_type == "double":
+            return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value '{value}' for field '{field}', expected {bson_type}")
+    return str(value)
+
+
+# fields=name,price selects the returned game fields; they are checked against the games schema
+# and replace the route's default projection, so Mongo only sends what the client asked for
+def field_projection(args, default):
+    if not args.get('fields'):
+        return default
+    fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+    valid = ["_id"] + list(games_validator["$jsonSchema"]["properties"])
+    unknown = [field for field in fields if field not in valid]
+    if unknown or not fields:
+        raise ValueError(f"Invalid fields {unknown}. Valid options are {valid}")
+    return dict({"_id": 0}, **dict.fromkeys(fields, 1))
+
+
+def build_games_query(args):
+    query = {}
+    for key, value in args.items():
+        if key in PAGINATION_ARGS or key in RESPONSE_ARGS:
+            continue
+        if key in GAMES_RANGE_FILTERS:
+            field, operator = GAMES_RANGE_FILTERS[key]
+        elif key in GAMES_FILTER_FIELDS:
+            field, operator = key, "$eq"
+        else:
+            raise ValueError(f"Unknown filter '{key}'. Valid options are "
+                             f"{GAMES_FILTER_FIELDS + list(GAMES_RANGE_FILTERS)}")
+        query.setdefault(field, {})[operator] = coerce_field(field, value)
+    return query
+
+
+# Queries that compare name or developer strings need the collation of their indexes
+def query_collation(query, sort_field=None):
+    if sort_field in CASE_INSENSITIVE_FIELDS or any(field in CASE_INSENSITIVE_FIELDS for field in query):
+        return CASE_INSENSITIVE
+    return None
+
+
+# Extended JSON keeps the type of the values: games added without an _id have an ObjectId
+def encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_page_cursor(token):
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError, TypeError, BSONError):
+        values = None
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f"Invalid 'after' cursor '{token}'")
+    return values
+
+
+def page_keyset(args, sort_field, descending):
+    if not args.get('after'):
+        return None
+    last_value, last_id = decode_page_cursor(args['after'])
+    operator = "$lt" if descending else "$gt"
+    if sort_field == "_id":
+        return id_keyset(last_id, operator)
+    return {"$or": [{sort_field: {operator: last_value}},
+                    dict(id_keyset(last_id, operator), **{sort_field: last_value})]}
+
+
+# Range operators only match values of the same BSON type. Games added without an _id get an ObjectId,
+# which sorts after every number, so the page after the last numeric _id goes on with the ObjectIds.
+def id_keyset(last_id, operator):
+    if isinstance(last_id, ObjectId) == (operator == "$gt"):
+        return {"_id": {operator: last_id}}
+    return {"$or": [{"_id": {operator: last_id}}, {"_id": {"$type": "objectId" if operator == "$gt" else "number"}}]}
+
+
+# Keyset pagination: the 'after' cursor holds the sort value and _id of the last game of the previous
+# page, so every page is an index range scan instead of skipping over all the earlier pages
+def page_request(query, args, projection):
+    sort = args.get('sort', '_id')
+    sort_field = sort.lstrip('-')
+    if sort_field not in GAMES_SORT_FIELDS:
+        raise ValueError(f"Invalid sort field '{sort_field}'. Valid options are {GAMES_SORT_FIELDS}")
+    descending = sort.startswith('-')
+    limit = int(args.get('limit', GAMES_PAGE_SIZE))
+    if not 0 < limit <= GAMES_MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {GAMES_MAX_PAGE_SIZE}")
+
+    collation = query_collation(query, sort_field)
+    keyset = page_keyset(args, sort_field, descending)
+    if keyset:
+        query = {"$and": [query, keyset]} if query else keyset
+
+    direction = pymongo.DESCENDING if descending else pymongo.ASCENDING
+    fields = dict(projection, _id=1)
+    fields[sort_field] = 1
+    find_args = {"filter": query, "projection": fields, "sort": [(sort_field, direction), ("_id", direction)],
+                 "limit": limit + 1, "collation": collation}
+    return find_args, sort_field, limit
+
+
+def page_response(games, sort_field, limit, projection):
+    next_cursor = None
+    if len(games) > limit:
+        games = games[:limit]
+        next_cursor = encode_page_cursor([games[-1].get(sort_field), games[-1]["_id"]])
+    for game in games:
+        for field in list(game):
+            if not projection.get(field):
+                del game[field]
+    return games, next_cursor
+
+
+# One aggregation for the browse page: the leading $match is served by the indexes of the filter fields,
+# then $facet computes the page (a top-k sort) and the counts from the same matched games in one pass
+def facets_pipeline(query, args, projection):
+    find_args, sort_field, limit = page_request(query, args, projection)
+    keyset = page_keyset(args, sort_field, args.get('sort', '_id').startswith('-'))
+    ratings_total = {"$add": ["$positive_ratings", "$negative_ratings"]}
+    rating_bucket = {"$min": [RATING_FACET_BUCKETS - 1, {"$floor": {"$multiply": [
+        {"$divide": ["$positive_ratings", ratings_total]}, RATING_FACET_BUCKETS]}}]}
+
+    facets = {
+        "games": ([{"$match": keyset}] if keyset else []) + [
+            {"$sort": dict(find_args["sort"])}, {"$limit": find_args["limit"]}, {"$project": find_args["projection"]}],
+        "total": [{"$count": "count"}],
+        # Every price the match lets through falls in a bucket, so $bucket needs no default
+        "price": [{"$match": {"price": {"$gte": PRICE_FACET_BOUNDARIES[0], "$lt": float('inf')}}},
+                  {"$bucket": {"groupBy": "$price", "boundaries": PRICE_FACET_BOUNDARIES + [float('inf')]}}],
+        "ratings": [{"$match": {"positive_ratings": {"$type": "number"}, "negative_ratings": {"$type": "number"},
+                                "$expr": {"$gt": [ratings_total, 0]}}},
+                    {"$group": {"_id": rating_bucket, "count": {"$sum": 1}}},
+                    {"$sort": {"_id": 1}}],
+    }
+    for field in GAMES_FACET_FIELDS:
+        facets[field] = [{"$unwind": f"${field}"}, {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                         {"$sort": {"count": -1, "_id": 1}}, {"$limit": GAMES_FACET_SIZE}]
+
+    fields = dict.fromkeys(GAMES_FACET_FIELDS + ["price", "positive_ratings", "negative_ratings"], 1)
+    fields.update(find_args["projection"])
+    pipeline = [{"$match": query}, {"$project": fields}, {"$facet": facets}]
+    return pipeline, find_args["collation"], sort_field, limit
+
+
+def facets_response(result, sort_field, limit, projection):
+    games, next_cursor = page_response(result["games"], sort_field, limit, projection)
+    facets = {field: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in result[field]]
+              for field in GAMES_FACET_FIELDS}
+    facets["price"] = []
+    for bucket in result["price"]:
+        i = PRICE_FACET_BOUNDARIES.index(bucket["_id"])
+        upper = PRICE_FACET_BOUNDARIES[i + 1] if i + 1 < len(PRICE_FACET_BOUNDARIES) else None
+        facets["price"].append({"min": bucket["_id"], "max": upper, "count": bucket["count"]})
+    facets["ratings"] = [{"min": bucket["_id"] / RATING_FACET_BUCKETS, "max": (bucket["_id"] + 1) / RATING_FACET_BUCKETS,
+                          "count": bucket["count"]} for bucket in result["ratings"]]
+    total = result["total"][0]["count"] if result["total"] else 0
+    return {"games": games, "after": next_cursor, "total": total, "facets": facets}
+
+
+def paginate_games(query, args, projection):
+    find_args, sort_field, limit = page_request(query, args, projection)
+    return page_response(list(database.games.find(**find_args)), sort_field, limit, projection)
+
+PRICE_FLOOR = 0.99
+
+# Responses of these types are compressed when the client accepts gzip or br and they are not tiny
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain"}
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVELS = {"br": 4, "gzip": 6}
+
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 30
+
+# Game fields each cached route is computed from; a write only drops the entries it can affect
+ROUTE_DEPENDENCIES = {
+    "top_genres": {"genres", "positive_ratings"},
+    "price_trend": {"price", "release_date", "release_year"},
+    "top_genres_by_year": {"genres", "positive_ratings", "release_date", "release_year"},
+    "developer_genre_ratings": {"developer", "genres", "positive_ratings"},
+    "get_system_requirements": {"name", "linux_requirements", "mac_requirements", "windows_requirements"},
+    "get_game_facets": set(GAMES_FILTER_FIELDS),
+}
+
+
+# Bounded LRU of rendered responses with a TTL. It lives in the server process, so
+# every worker keeps its own copy and only sees the writes it handles itself.
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires"] <= time.monotonic():
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+
+    def put(self, key, response, dependencies):
+        body = response.get_data()
+        entry = {
+            "body": body,
+            "mimetype": response.mimetype,
+            "etag": hashlib.blake2b(body, digest_size=16).hexdigest(),
+            "last_modified": datetime.now(timezone.utc).replace(microsecond=0),
+            "expires": time.monotonic() + self.ttl,
+            "dependencies": dependencies,
+            "encoded": {},
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+        return entry
+
+    # Drops the entries that depend on any of the written fields, or every entry when fields is None
+    def invalidate(self, fields=None):
+        with self.lock:
+            stale = [key for key, entry in self.entries.items()
+                     if fields is None or entry["dependencies"] & set(fields)]
+            for key in stale:
+                del self.entries[key]
+            self.counters["invalidations"] += len(stale)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, size=len(self.entries), max_entries=self.max_entries, ttl=self.ttl)
+
+
+response_cache = ResponseCache()
+# Set by every write route; the analytics snapshot re-exports after it is set
+games_changed = threading.Event()
+
+
+# The best encoding the client accepts, br before gzip at equal quality
+def response_encoding(accept_encodings):
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = max(encodings, key=lambda encoding: accept_encodings[encoding])
+    return encoding if accept_encodings[encoding] else None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_LEVELS["br"])
+    compressor = zlib.compressobj(COMPRESS_LEVELS["gzip"], wbits=31)
+    return compressor.compress(body) + compressor.flush()
+
+
+# (compress, finish) functions of a streaming compressor. compress flushes after every chunk so that
+# a streamed response keeps reaching the client as it is produced.
+def stream_compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_LEVELS["br"])
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVELS["gzip"], wbits=31)
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    compress_chunk, finish = stream_compressor(encoding)
+    for chunk in chunks:
+        yield compress_chunk(chunk)
+    yield finish()
+
+
+def compressible(response):
+    return (response.status_code == 200 and "Content-Encoding" not in response.headers
+            and response.mimetype in COMPRESSIBLE_MIMETYPES)
+
+
+# A compressed body gets a weak ETag: it is the same resource, and If-None-Match still matches it
+def mark_compressed(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+
+
+# Cached entries keep their compressed bodies, so a cache hit does not compress again
+def cached_response(entry):
+    encoding = None
+    if len(entry["body"]) >= COMPRESS_MIN_BYTES and entry["mimetype"] in COMPRESSIBLE_MIMETYPES:
+        encoding = response_encoding(request.accept_encodings)
+    body = entry["body"]
+    if encoding:
+        if encoding not in entry["encoded"]:
+            entry["encoded"][encoding] = compress(body, encoding)
+        body = entry["encoded"][encoding]
+    response = Response(body, mimetype=entry["mimetype"])
+    response.vary.add("Accept-Encoding")
+    response.set_etag(entry["etag"], weak=encoding is not None)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.last_modified = entry["last_modified"]
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# Serves a GET route from response_cache, keyed on the endpoint and its normalized arguments,
+# and answers If-None-Match/If-Modified-Since requests with 304
+def cached_route(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = response_cache.put(key, response, ROUTE_DEPENDENCIES[view.__name__])
+        return cached_response(entry)
+    return wrapper
+
+
+#http://127.0.0.1:5000/cache/stats
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+# Streamed responses (the CSV export) have no known length and are left out of the size histogram
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    record_request(route, request.method, response.status_code,
+                   time.perf_counter() - g.get("request_started", time.perf_counter()),
+                   response.calculate_content_length())
+    return response
+
+
+# Registered after the metrics hook so that it runs first and the size histogram sees the bytes sent
+@app.after_request
+def compress_response(response):
+    if not compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = response_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(body, encoding))
+    mark_compressed(response, encoding)
+    return response
+
+
+#http://127.0.0.1:5000/metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 
 #http://127.0.0.1:5000/games
+#http://127.0.0.1:5000/games?genres=Action&min_price=5&max_price=20&sort=-positive_ratings&limit=20
 @app.route('/games', methods=['GET'])
 def get_games():
-    query = request.args.to_dict()
-    projection = {"_id": 0, "name": 1, "price": 1, "genres": 1, "positive_ratings": 1}
-    results = list(database.games.find(query, projection))
-    return jsonify(results)
+    try:
+        projection = field_projection(request.args, GAMES_PROJECTION)
+        query = build_games_query(request.args.to_dict())
+        games, next_cursor = paginate_games(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"games": games, "after": next_cursor})
+
+
+# The page of /games together with counts per genre, tag, platform and price band and a histogram of
+# the positive rating share, all over the games matching the filters
+#http://127.0.0.1:5000/games/facets?genres=Action&max_price=20
+@app.route('/games/facets', methods=['GET'])
+@cached_route
+def get_game_facets():
+    try:
+        projection = field_projection(request.args, GAMES_PROJECTION)
+        query = build_games_query(request.args.to_dict())
+        pipeline, collation, sort_field, limit = facets_pipeline(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = next(database.games.aggregate(pipeline, collation=collation))
+    return jsonify(facets_response(result, sort_field, limit, projection))
+
+
+def parse_release_year(release_date):
+    match = RELEASE_YEAR.search(str(release_date))
+    return int(match.group()) if match else None
+
+
+REQUIREMENT_SYSTEMS = {"windows": "windows_requirements", "mac": "mac_requirements", "linux": "linux_requirements"}
+REQUIREMENT_LEVELS = ["minimum", "recommended"]
+REQUIREMENT_SIZE = r'(\d+(?:\.\d+)?)\s*(tb|gb|mb)\+?'
+RECOMMENDED_SECTION = re.compile(r'recommended\s*:')
+# Patterns tried in order on the cleaned, lower-cased requirement text of one level, e.g.
+# "os: windows 7processor: 2.4 ghzmemory: 4 gb ramgraphics: 1024 mb vramstorage: 10 gb available space"
+# or the older free-form "500 mhz processor, 96mb ram, 16mb video card"
+REQUIREMENT_SIZE_PATTERNS = {
+    "ram_gb": [re.compile(r'(?<!video )(?<!graphics )memory\s*:\s*' + REQUIREMENT_SIZE),
+               re.compile(REQUIREMENT_SIZE + r'\s*(?:of\s+)?(?:system\s+)?(?:ram|memory)\b')],
+    "storage_gb": [re.compile(r'(?:storage|hard drive|hard disk|disk space|hdd)\s*:\s*' + REQUIREMENT_SIZE),
+                   re.compile(REQUIREMENT_SIZE + r'\s*(?:of\s+)?(?:free\s+|available\s+)?(?:hard drive\s+|hdd\s+|disk\s+)?space')],
+    "gpu_memory_gb": [re.compile(r'(?:graphics|video card)\s*:[^:]*?' + REQUIREMENT_SIZE),
+                      re.compile(REQUIREMENT_SIZE + r'\s*(?:of\s+)?(?:dedicated\s+)?(?:vram|video\s*(?:ram|memory|card))')],
+}
+REQUIREMENT_OS = re.compile(r'\bos\s*:\s*(.*?)\s*(?:processor|cpu|memory|graphics|video card|storage|hard drive|directx|'
+                            r'network|sound card|additional notes|$)')
+REQUIREMENT_UNITS = {"tb": 1024, "gb": 1, "mb": 1 / 1024}
+
+
+def parse_requirement_level(text):
+    level = {}
+    for field, patterns in REQUIREMENT_SIZE_PATTERNS.items():
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                level[field] = round(float(match.group(1)) * REQUIREMENT_UNITS[match.group(2)], 3)
+                break
+    match = REQUIREMENT_OS.search(text)
+    if match and match.group(1).strip(' ,'):
+        level["os"] = match.group(1).strip(' ,')[:100]
+    return level
+
+
+# One entry per system and level with the RAM, storage and GPU memory in GB and the OS parsed out of the
+# cleaned requirement strings; a system with requirement text always has a minimum entry, even an empty one
+def parse_system_requirements(game):
+    entries = []
+    for system, field in REQUIREMENT_SYSTEMS.items():
+        text = game.get(field)
+        if not isinstance(text, str) or text == "No Data Available":
+            continue
+        # Stored lower-cased by ingest and add_derived_fields, but games written through the API before
+        # then still hold the text as sent
+        text = text.lower()
+        recommended = RECOMMENDED_SECTION.search(text)
+        entries.append(dict({"system": system, "level": "minimum"},
+                            **parse_requirement_level(text[:recommended.start()] if recommended else text)))
+        if recommended:
+            entries.append(dict({"system": system, "level": "recommended"},
+                                **parse_requirement_level(text[recommended.end():])))
+    return entries
+
+
+# Fields stored next to the source data so that reads do not have to recompute them. system_requirements
+# needs all three requirement strings and wilson_score both rating counts; partial updates call
+# refresh_system_requirements and refresh_wilson_scores after the write.
+def add_derived_fields(game):
+    # Requirement text is stored lower-cased, as ingest stores it
+    for field in REQUIREMENT_SYSTEMS.values():
+        if isinstance(game.get(field), str) and game[field] != "No Data Available":
+            game[field] = game[field].lower()
+    if "release_date" in game:
+        game["release_year"] = parse_release_year(game["release_date"])
+    if "name" in game:
+        game["name_lower"] = str(game["name"]).lower()
+    if all(field in game for field in REQUIREMENT_SYSTEMS.values()):
+        game["system_requirements"] = parse_system_requirements(game)
+    if "positive_ratings" in game and "negative_ratings" in game:
+        game["wilson_score"] = game_wilson_score(game)
+    return game
+
+
+def refresh_system_requirements(game_ids):
+    games = database.games.find({"_id": {"$in": list(game_ids)}}, {field: 1 for field in REQUIREMENT_SYSTEMS.values()})
+    updates = [UpdateOne({"_id": game["_id"]}, {"$set": {"system_requirements": parse_system_requirements(game)}})
+               for game in games]
+    if updates:
+        database.games.bulk_write(updates, ordered=False)
+
+
+def refresh_wilson_scores(game_ids):
+    games = database.games.find({"_id": {"$in": list(game_ids)}}, {"positive_ratings": 1, "negative_ratings": 1})
+    updates = [UpdateOne({"_id": game["_id"]}, {"$set": {"wilson_score": game_wilson_score(game)}}) for game in games]
+    if updates:
+        database.games.bulk_write(updates, ordered=False)
+
+
+# Sets the derived fields on games stored before they existed
+def backfill_derived_fields():
+    games = database.games.find({"$or": [{"release_year": {"$exists": False}}, {"name_lower": {"$exists": False}},
+                                         {"system_requirements": {"$exists": False}},
+                                         {"wilson_score": {"$exists": False}},
+                                         # Requirements sent through the API before they were lower-cased;
+                                         # the $set below stores them lower-cased so they match once
+                                         *({field: {"$regex": "[A-Z]", "$ne": "No Data Available"}}
+                                           for field in REQUIREMENT_SYSTEMS.values())]},
+                                dict({"name": 1, "release_date": 1, "positive_ratings": 1, "negative_ratings": 1},
+                                     **{field: 1 for field in REQUIREMENT_SYSTEMS.values()}))
+    backfill = [UpdateOne({"_id": game.pop("_id")}, {"$set": add_derived_fields(game)}) for game in games]
+    if backfill:
+        database.games.bulk_write(backfill, ordered=False)
+    return len(backfill)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Lower bound of the 95% Wilson score interval of the share of positive ratings: a game with a few
+# ratings ranks below one with the same share over many more
+def wilson_score(positive, negative):
+    n = positive + negative
+    if n <= 0:
+        return 0.0
+    share = positive / n
+    z2 = WILSON_Z * WILSON_Z
+    return (share + z2 / (2 * n) - WILSON_Z * math.sqrt((share * (1 - share) + z2 / (4 * n)) / n)) / (1 + z2 / n)
+
+
+def game_wilson_score(game):
+    positive, negative = game.get("positive_ratings"), game.get("negative_ratings")
+    if not is_number(positive) or not is_number(negative):
+        return None
+    return wilson_score(positive, negative)
+
+
+# The (report, key, value) pairs a game adds to the materialized reports; like $avg,
+# values that are missing or not numeric are left out
+def report_contributions(game):
+    year = game.get("release_year")
+    genres = game.get("genres", [])
+    if not isinstance(genres, list):
+        genres = [genres]
+    positive_ratings = game.get("positive_ratings")
+
+    if is_number(positive_ratings):
+        for genre in genres:
+            yield "genre_ratings", {"genre": genre}, positive_ratings
+            yield "year_genre_ratings", {"year": year, "genre": genre}, positive_ratings
+        if "developer" in game:
+            yield "developer_genre_ratings", {"developer": game["developer"], "genres": genres}, positive_ratings
+    if is_number(game.get("price")):
+        yield "year_prices", {"year": year}, game["price"]
+
+
+def report_deltas(removed=(), added=()):
+    deltas = {}
+    for games, sign in ((removed, -1), (added, 1)):
+        for game in games:
+            for report, key, value in report_contributions(game):
+                delta = deltas.setdefault(json.dumps([report, key]), [report, key, 0, 0])
+                delta[2] += sign * value
+                delta[3] += sign
+    return [delta for delta in deltas.values() if delta[2] or delta[3]]
+
+
+def report_operations(removed=(), added=()):
+    return [
+        UpdateOne({"report": report, "key": key}, {"$inc": {"sum": total, "count": count}}, upsert=True)
+        for report, key, total, count in report_deltas(removed, added)
+    ]
+
+
+# Applies the sum/count changes of written games to the report_stats collection
+def update_reports(removed=(), added=()):
+    operations = report_operations(removed, added)
+    if operations:
+        database.report_stats.bulk_write(operations, ordered=False)
+
+
+def top_genres_result(averages):
+    result = [{"_id": key["genre"], "average_rating": average} for key, average in averages]
+    result.sort(key=lambda row: row["average_rating"], reverse=True)
+    return result[:5]
+
+
+# The reports keep the "YYYY" strings they returned when the year was cut out of release_date;
+# games without a year are grouped under null
+def year_label(year):
+    return None if year is None else str(year)
+
+
+def price_trend_result(averages):
+    result = [{"_id": year_label(key["year"]), "average_price": average} for key, average in averages]
+    result.sort(key=lambda row: (row["_id"] is not None, row["_id"]))
+    return result
+
+
+def top_genres_by_year_result(averages):
+    result = [{"_id": {"year": year_label(key["year"]), "genre": key["genre"]}, "average_rating": average}
+              for key, average in averages]
+    result.sort(key=lambda row: row["average_rating"], reverse=True)
+    return result[:10]
+
+
+def developer_genre_ratings_result(averages):
+    return [{"_id": {"developer": key["developer"], "genre": key["genres"]}, "average_rating": average}
+            for key, average in averages]
+
+
+# Route name -> (report_stats report, sort, limit, function shaping the averages like the original aggregation)
+REPORTS = {
+    "top_genres": ("genre_ratings", None, 0, top_genres_result),
+    "price_trend": ("year_prices", None, 0, price_trend_result),
+    "top_genres_by_year": ("year_genre_ratings", None, 0, top_genres_by_year_result),
+    "developer_genre_ratings": ("developer_genre_ratings",
+                                [("key.developer", pymongo.ASCENDING), ("key.genres", pymongo.ASCENDING)], 50,
+                                developer_genre_ratings_result),
+}
+
+
+def report_find_args(name):
+    report, sort, limit, _ = REPORTS[name]
+    return {"filter": {"report": report, "count": {"$gt": 0}}, "projection": {"_id": 0, "key": 1, "sum": 1, "count": 1},
+            "sort": sort, "limit": limit}
+
+
+def report_result(name, stats):
+    return REPORTS[name][3]([(stat["key"], stat["sum"] / stat["count"]) for stat in stats])
+
+
+def read_report(name):
+    return report_result(name, database.report_stats.find(**report_find_args(name)))
+
+
+# Recomputes report_stats from the games collection, reports how far the incremental
+# counters had drifted and swaps the fresh documents in
+def rebuild_reports():
+    backfilled = backfill_derived_fields()
+
+    projection = {"_id": 0, "genres": 1, "developer": 1, "positive_ratings": 1, "price": 1, "release_year": 1}
+    stats = [{"report": report, "key": key, "sum": total, "count": count}
+             for report, key, total, count in report_deltas(added=database.games.find({}, projection))]
+
+    current = {json.dumps([stat["report"], stat["key"]]): (round(stat["sum"], 6), stat["count"])
+               for stat in database.report_stats.find({"count": {"$gt": 0}})}
+    drifted = sum(1 for stat in stats
+                  if current.pop(json.dumps([stat["report"], stat["key"]]), None) != (round(stat["sum"], 6), stat["count"]))
+    drifted += len(current)
+
+    rebuilt = database.report_stats_rebuild
+    rebuilt.drop()
+    if stats:
+        rebuilt.insert_many(stats, ordered=False)
+        rebuilt.rename("report_stats", dropTarget=True)
+    else:
+        database.report_stats.drop()
+    ensure_report_indexes()
+    print(f"Rebuilt {len(stats)} report documents, {drifted} had drifted, backfilled derived fields on {backfilled} games")
+
+
+def ensure_report_indexes():
+    database.report_stats.create_indexes([
+        IndexModel([("report", pymongo.ASCENDING), ("key", pymongo.ASCENDING)], name="report_key", unique=True),
+        IndexModel([("report", pymongo.ASCENDING), ("key.developer", pymongo.ASCENDING),
+                    ("key.genres", pymongo.ASCENDING)], name="report_developer_genres"),
+    ])
+
+
+LEADERBOARD_DIMENSIONS = {"genre": "genres", "tag": "tags", "developer": "developer", "year": "release_year"}
+LEADERBOARD_SIZE = 100
+LEADERBOARD_K = 10
+LEADERBOARD_FIELDS = {"_id": 1, "name": 1, "genres": 1, "tags": 1, "developer": 1, "release_year": 1,
+                      "positive_ratings": 1, "negative_ratings": 1}
+WILSON_Z = 1.96
+
+
+# The (dimension, key) of every leaderboard a game is ranked in
+def leaderboard_keys(game):
+    for dimension, field in LEADERBOARD_DIMENSIONS.items():
+        values = game.get(field)
+        for value in dict.fromkeys(values if isinstance(values, list) else [values]):
+            if value is not None:
+                yield dimension, value
+
+
+def leaderboard_entry(game, score):
+    return {"_id": game["_id"], "name": game.get("name"), "score": score,
+            "positive_ratings": game["positive_ratings"], "negative_ratings": game["negative_ratings"]}
+
+
+def leaderboard_filter(key):
+    return {"dimension": key[0], "key": key[1]}
+
+
+# Each leaderboard keeps its LEADERBOARD_SIZE best entries by Wilson score and the number of scored games
+# in it. Old versions of written games are $pulled, new ones $pushed with $sort and $slice, so every
+# change is an atomic update of one leaderboard document.
+def leaderboard_operations(removed=(), added=()):
+    pulls, pushes, counts = {}, {}, {}
+    for game in removed:
+        if game_wilson_score(game) is None:
+            continue
+        for key in leaderboard_keys(game):
+            pulls.setdefault(key, []).append(game["_id"])
+            counts[key] = counts.get(key, 0) - 1
+    for game in added:
+        score = game_wilson_score(game)
+        if score is None:
+            continue
+        for key in leaderboard_keys(game):
+            pushes.setdefault(key, []).append(leaderboard_entry(game, score))
+            counts[key] = counts.get(key, 0) + 1
+
+    operations = [UpdateOne(leaderboard_filter(key), {"$pull": {"entries": {"_id": {"$in": ids}}}})
+                  for key, ids in pulls.items()]
+    for key, count in counts.items():
+        update = {"$inc": {"games": count}}
+        if key in pushes:
+            update["$push"] = {"entries": {"$each": pushes[key], "$sort": {"score": -1, "_id": 1},
+                                           "$slice": LEADERBOARD_SIZE}}
+        operations.append(UpdateOne(leaderboard_filter(key), update, upsert=True))
+    return operations
+
+
+# A full leaderboard that loses a member, or whose member drops below its last entry, may now be missing
+# a game ranked just outside it. Shorter leaderboards hold every scored game of their key and stay exact.
+def stale_leaderboards(removed, added):
+    new_scores = {}
+    for game in added:
+        score = game_wilson_score(game)
+        if score is not None:
+            for key in leaderboard_keys(game):
+                new_scores[key, game["_id"]] = score
+    removed_ids = {}
+    for game in removed:
+        if game_wilson_score(game) is not None:
+            for key in leaderboard_keys(game):
+                removed_ids.setdefault(key, []).append(game["_id"])
+    if not removed_ids:
+        return []
+
+    stale = []
+    boards = database.leaderboards.find({"$or": [leaderboard_filter(key) for key in removed_ids]},
+                                        {"dimension": 1, "key": 1, "entries._id": 1, "entries.score": 1})
+    for board in boards:
+        entries = board.get("entries", [])
+        if len(entries) < LEADERBOARD_SIZE:
+            continue
+        key = (board["dimension"], board["key"])
+        members = {entry["_id"] for entry in entries}
+        if any(game_id in members and new_scores.get((key, game_id), -1) < entries[-1]["score"]
+               for game_id in removed_ids[key]):
+            stale.append(key)
+    return stale
+
+
+# Applies written games to the leaderboards. removed and added are the games before and after the writes,
+# with at most one version of each game; stale leaderboards are refilled from the games collection.
+def update_leaderboards(removed=(), added=()):
+    operations = leaderboard_operations(removed, added)
+    if not operations:
+        return
+    stale = stale_leaderboards(removed, added)
+    database.leaderboards.bulk_write(operations, ordered=True)
+    if stale:
+        refill_leaderboards(stale)
+
+
+def refill_leaderboards(keys):
+    for dimension, key in keys:
+        games = database.games.find({LEADERBOARD_DIMENSIONS[dimension]: key, "wilson_score": {"$type": "number"}},
+                                    LEADERBOARD_FIELDS, sort=[("wilson_score", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)],
+                                    limit=LEADERBOARD_SIZE)
+        entries = [leaderboard_entry(game, game_wilson_score(game)) for game in games]
+        database.leaderboards.update_one({"dimension": dimension, "key": key}, {"$set": {"entries": entries}})
+
+
+# Recomputes every leaderboard with one bounded heap per leaderboard and swaps them in, like rebuild_reports.
+# Games are read in _id order, so equal scores keep the lower _id first as in the $push sort.
+def rebuild_leaderboards():
+    boards = {}
+    games = database.games.find({}, LEADERBOARD_FIELDS, sort=[("_id", pymongo.ASCENDING)])
+    for position, game in enumerate(games):
+        score = game_wilson_score(game)
+        if score is None:
+            continue
+        entry = leaderboard_entry(game, score)
+        for key in leaderboard_keys(game):
+            board = boards.setdefault(key, [0, []])
+            board[0] += 1
+            item = (score, -position, entry)
+            if len(board[1]) < LEADERBOARD_SIZE:
+                heapq.heappush(board[1], item)
+            elif item[:2] > board[1][0][:2]:
+                heapq.heapreplace(board[1], item)
+
+    documents = [{"dimension": dimension, "key": key, "games": games,
+                  "entries": [entry for _, _, entry in sorted(heap, key=lambda item: item[:2], reverse=True)]}
+                 for (dimension, key), (games, heap) in boards.items()]
+    rebuilt = database.leaderboards_rebuild
+    rebuilt.drop()
+    if documents:
+        rebuilt.insert_many(documents, ordered=False)
+        rebuilt.rename("leaderboards", dropTarget=True)
+    else:
+        database.leaderboards.drop()
+    ensure_leaderboard_indexes()
+    print(f"Rebuilt {len(documents)} leaderboards")
+
+
+def ensure_leaderboard_indexes():
+    database.leaderboards.create_indexes([
+        IndexModel([("dimension", pymongo.ASCENDING), ("key", pymongo.ASCENDING)], name="dimension_key", unique=True),
+    ])
+
+
+def leaderboard_args(dimension, key, args):
+    if dimension not in LEADERBOARD_DIMENSIONS:
+        raise ValueError(f"Invalid dimension '{dimension}'. Valid options are {list(LEADERBOARD_DIMENSIONS)}")
+    if dimension == "year":
+        try:
+            key = int(key)
+        except ValueError:
+            raise ValueError(f"Invalid year '{key}'")
+    try:
+        k = int(args.get('k', LEADERBOARD_K))
+    except ValueError:
+        k = 0
+    if not 0 < k <= LEADERBOARD_SIZE:
+        raise ValueError(f"'k' must be an integer between 1 and {LEADERBOARD_SIZE}")
+    return {"dimension": dimension, "key": key}, {"_id": 0, "games": 1, "entries": {"$slice": k}}
+
+
+def leaderboard_result(query, board):
+    return {"dimension": query["dimension"], "key": query["key"], "games": board.get("games", 0),
+            "leaderboard": [dict(entry, rank=rank) for rank, entry in enumerate(board.get("entries", []), 1)]}
+
 
 #http://127.0.0.1:5000/reports/top_genres
 @app.route('/reports/top_genres', methods=['GET'])
+@cached_route
 def top_genres():
-    pipeline = [
-        {"$unwind": "$genres"},
-        {"$group": {"_id": "$genres", "average_rating": {"$avg": "$positive_ratings"}}},
-        {"$sort": {"average_rating": -1}},
-        {"$limit": 5}
-    ]
-    result = list(database.games.aggregate(pipeline))
-    return jsonify(result)
+    return jsonify(read_report("top_genres"))
 
 
-#http://127.0.0.1:5000/games/export?min_price=5&max_price=20
-@app.route('/games/export', methods=['GET'])
-def export_games():
-    min_price = float(request.args.get('min_price', 5))
-    max_price = float(request.args.get('max_price', 10))
-    query = {"price": {"$gte": min_price, "$lte": max_price}}
+# Games of one genre, tag, developer or release year ranked by the Wilson lower bound of their positive
+# share; reads the first k entries of a precomputed list
+#http://127.0.0.1:5000/reports/leaderboard/genre/Action
+#http://127.0.0.1:5000/reports/leaderboard/year/2018?k=25
+@app.route('/reports/leaderboard/<dimension>/<path:key>', methods=['GET'])
+def leaderboard(dimension, key):
+    try:
+        query, projection = leaderboard_args(dimension, key, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    board = database.leaderboards.find_one(query, projection)
+    if board is None:
+        return jsonify({"error": f"No leaderboard for {dimension} '{key}'"}), 404
+    return jsonify(leaderboard_result(query, board))
+
+
+EXPORT_FIELDS = ["name", "price", "positive_ratings", "tags"]
+EXPORT_SORT_FIELDS = ["_id", "name", "price", "positive_ratings"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(str(v) for v in value)
+    return value
+
+
+# The lines of a list of exported games, after the CSV header when header is set
+def export_text(games, export_format, fields, header=False):
+    if export_format == "ndjson":
+        return "".join(app.json.dumps(game) + "\n" for game in games)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows([export_csv_value(game.get(field, "")) for field in fields] for game in games)
+    return buffer.getvalue()
+
+
+# The find arguments, format and columns of an export request; raises ValueError on invalid arguments
+def export_request(args):
+    try:
+        min_price = float(args.get('min_price', 5))
+        max_price = float(args.get('max_price', 10))
+        batch_size = int(args.get('batch_size', EXPORT_BATCH_SIZE))
+        limit = int(args.get('limit', 0))
+    except ValueError as e:
+        raise ValueError(f"Invalid parameter: {e}")
+    if batch_size <= 0 or limit < 0:
+        raise ValueError("'batch_size' must be positive and 'limit' must not be negative")
+
+    sort = args.get('sort', '_id')
+    sort_field = sort.lstrip('-')
+    if sort_field not in EXPORT_SORT_FIELDS:
+        raise ValueError(f"Invalid sort field '{sort_field}'. Valid options are {EXPORT_SORT_FIELDS}")
+    direction = pymongo.DESCENDING if sort.startswith('-') else pymongo.ASCENDING
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format '{export_format}'. Valid options are {list(EXPORT_FORMATS)}")
+    projection = field_projection(args, dict({"_id": 0}, **dict.fromkeys(EXPORT_FIELDS, 1)))
+
+    find_args = {"filter": {"price": {"$gte": min_price, "$lte": max_price}}, "projection": projection,
+                 "batch_size": batch_size, "limit": limit, "sort": [(sort_field, direction)]}
+    return find_args, export_format, [field for field, included in projection.items() if included]
+
+
+def export_headers(export_format, gzipped):
+    filename = f"games.{export_format}.gz" if gzipped else f"games.{export_format}"
+    return {"Content-Disposition": f"attachment;filename={filename}"}
+
+
+def generate_csv(first_game, cursor, fields=EXPORT_FIELDS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    try:
+        writer.writerow(fields)
+        for game in itertools.chain([first_game], cursor):
+            writer.writerow([export_csv_value(game.get(field, "")) for field in fields])
+            if game is first_game or buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        cursor.close()
+
+
+# One JSON document per line, so clients can parse the export while it downloads
+def generate_ndjson(first_game, cursor):
+    lines = []
+    size = 0
+    try:
+        for game in itertools.chain([first_game], cursor):
+            line = app.json.dumps(game)
+            lines.append(line)
+            size += len(line)
+            if game is first_game or size >= EXPORT_FLUSH_BYTES:
+                yield "\n".join(lines) + "\n"
+                lines = []
+                size = 0
+        if lines:
+            yield "\n".join(lines) + "\n"
+    finally:
+        cursor.close()
 
-    games = list(database.games.find(query, {"_id": 0, "name": 1, "price": 1, "positive_ratings": 1, "tags": 1}))
 
-    print("Games fetched:", games)
+def gzip_stream(chunks):
+    return compress_stream((chunk.encode('utf-8') for chunk in chunks), "gzip")
 
-    if not games:
-        return jsonify({"error": "No games found matching the criteria"}), 404
 
-    # CSV generation
-    def generate_csv():
-        fieldnames = ["name", "price", "positive_ratings", "tags"]
-        output = [','.join(fieldnames)]
-        for game in games:
-            row = [str(game.get(field, "")) for field in fieldnames]
-            output.append(','.join(row))
-        return '\n'.join(output)
+#http://127.0.0.1:5000/games/export?min_price=5&max_price=20
+#http://127.0.0.1:5000/games/export?min_price=5&max_price=20&sort=-positive_ratings&limit=1000&gzip=1
+@app.route('/games/export', methods=['GET'])
+def export_games():
+    try:
+        find_args, export_format, fields = export_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = database.games.find(**find_args)
+    first_game = next(cursor, None)
+    if first_game is None:
+        cursor.close()
+        return jsonify({"error": "No games found matching the criteria"}), 404
 
-    csv_data = generate_csv()
-    return Response(csv_data, mimetype='text/csv', headers={"Content-Disposition": "attachment;filename=games.csv"})
+    if export_format == "ndjson":
+        chunks = generate_ndjson(first_game, cursor)
+    else:
+        chunks = generate_csv(first_game, cursor, fields)
+    if request.args.get('gzip', '').lower() in ('1', 'true'):
+        return Response(gzip_stream(chunks), mimetype='application/gzip', headers=export_headers(export_format, True))
+    return Response(chunks, mimetype=EXPORT_FORMATS[export_format], headers=export_headers(export_format, False))
 
 #http://127.0.0.1:5000/reports/price-trend
 @app.route('/reports/price-trend', methods=['GET'])
+@cached_route
 def price_trend():
-    pipeline = [
-        {
-            "$addFields": {
-                "release_year": {"$substr": ["$release_date", 0, 4]}
-            }
-        },
-        {"$group": {"_id": "$release_year", "average_price": {"$avg": "$price"}}},
-        {"$sort": {"_id": 1}}
-    ]
-    result = list(database.games.aggregate(pipeline))
-    return jsonify(result)
+    return jsonify(read_report("price_trend"))
+
+SIMILARITY_TOP_K = 50
+SIMILARITY_CHUNK_SIZE = 500
+# Games read as candidates per updated game, and updated games a request handles before the rest go
+# to the background thread
+SIMILARITY_CANDIDATE_LIMIT = 2000
+SIMILARITY_INLINE_UPDATES = 20
+RECOMMENDATION_FILTERS = {"genre": "genres", "tag": "tags", "min_price": "min_price", "max_price": "max_price",
+                          "min_ratings": "min_ratings"}
+
+
+def game_tokens(game):
+    return ({f"genre:{genre}" for genre in game.get("genres") or []} |
+            {f"tag:{tag}" for tag in game.get("tags") or []})
+
+
+# TF-IDF weights of a game's genre/tag tokens, L2-normalized so that a dot product is the cosine similarity
+def game_vector(game, idf, default_idf):
+    weights = {token: idf.get(token, default_idf) for token in game_tokens(game)}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {token: weight / norm for token, weight in weights.items()} if norm else {}
+
+
+def similarity(vector, other):
+    if len(other) < len(vector):
+        vector, other = other, vector
+    return sum(weight * other.get(token, 0.0) for token, weight in vector.items())
+
+
+def similarity_document(game_id, neighbours, k):
+    neighbours = neighbours[:k]
+    return {
+        "_id": game_id,
+        "neighbours": [{"_id": neighbour, "score": round(score, 6)} for neighbour, score in neighbours],
+        "min_score": neighbours[-1][1] if len(neighbours) == k else 0.0,
+    }
+
+
+# Games sharing the rarest genres and tags first, one indexed find per token, until SIMILARITY_CANDIDATE_LIMIT
+# games are read. A game sharing only common tokens scores low, so the cap rarely drops a real neighbour,
+# and the next ingest.build_similarity_index scores every pair again.
+def similarity_candidates(game, idf, default_idf):
+    tokens = sorted(game_tokens(game), key=lambda token: (-idf.get(token, default_idf), token))
+    candidates, read = {}, 0
+    for token in tokens:
+        if read >= SIMILARITY_CANDIDATE_LIMIT:
+            break
+        kind, value = token.split(":", 1)
+        cursor = database.games.find({"genres" if kind == "genre" else "tags": value, "_id": {"$ne": game["_id"]}},
+                                     {"_id": 1, "genres": 1, "tags": 1}).limit(SIMILARITY_CANDIDATE_LIMIT - read)
+        for candidate in cursor:
+            read += 1
+            candidates[candidate["_id"]] = candidate
+    return candidates.values()
+
+
+# Recomputes the neighbours of new or edited games against the idf weights of the last build and
+# inserts them into the lists of the games they now beat. Lists that lose an entry are not refilled
+# until the next ingest.build_similarity_index.
+def update_similarity(game_ids):
+    meta = database.similarity_meta.find_one({"_id": "idf"})
+    if meta is None:
+        return
+    idf, default_idf, k = dict(meta["idf"]), meta["default_idf"], meta["k"]
+
+    operations = []
+    for game in database.games.find({"_id": {"$in": list(game_ids)}}, {"_id": 1, "genres": 1, "tags": 1}):
+        vector = game_vector(game, idf, default_idf)
+        scores = {}
+        for candidate in similarity_candidates(game, idf, default_idf):
+            score = similarity(vector, game_vector(candidate, idf, default_idf))
+            if score > 0:
+                scores[candidate["_id"]] = score
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        operations.append(ReplaceOne({"_id": game["_id"]}, similarity_document(game["_id"], ranked, k), upsert=True))
+
+        affected = database.similar_games.find(
+            {"$or": [{"neighbours._id": game["_id"]},
+                     {"_id": {"$in": list(scores)}, "min_score": {"$lt": ranked[0][1] if ranked else 0}}]})
+        for entry in affected:
+            listed = any(n["_id"] == game["_id"] for n in entry["neighbours"])
+            if not listed and scores.get(entry["_id"], 0) <= entry["min_score"]:
+                continue
+            neighbours = [(n["_id"], n["score"]) for n in entry["neighbours"] if n["_id"] != game["_id"]]
+            if entry["_id"] in scores:
+                neighbours.append((game["_id"], scores[entry["_id"]]))
+            neighbours.sort(key=lambda item: item[1], reverse=True)
+            operations.append(ReplaceOne({"_id": entry["_id"]}, similarity_document(entry["_id"], neighbours, k)))
+
+    if operations:
+        database.similar_games.bulk_write(operations, ordered=True)
+
+
+similarity_updates = None
+similarity_updates_lock = threading.Lock()
+
+
+# Updates the first SIMILARITY_INLINE_UPDATES games now and queues the rest for a background thread,
+# so that a bulk write does not wait for thousands of candidate scans
+def update_similarity_later(game_ids):
+    global similarity_updates
+    game_ids = list(game_ids)
+    update_similarity(game_ids[:SIMILARITY_INLINE_UPDATES])
+    if len(game_ids) <= SIMILARITY_INLINE_UPDATES:
+        return
+    with similarity_updates_lock:
+        if similarity_updates is None:
+            similarity_updates = queue.Queue()
+            threading.Thread(target=run_similarity_updates, daemon=True).start()
+    similarity_updates.put(game_ids[SIMILARITY_INLINE_UPDATES:])
+
+
+def run_similarity_updates():
+    while True:
+        game_ids = similarity_updates.get()
+        for start in range(0, len(game_ids), SIMILARITY_INLINE_UPDATES):
+            try:
+                update_similarity(game_ids[start:start + SIMILARITY_INLINE_UPDATES])
+            except Exception as e:
+                print(f"Similarity update failed: {e}", file=sys.stderr)
+        similarity_updates.task_done()
+
+
+def remove_from_similarity(game_ids):
+    database.similar_games.delete_many({"_id": {"$in": list(game_ids)}})
+    database.similar_games.update_many({"neighbours._id": {"$in": list(game_ids)}},
+                                       {"$pull": {"neighbours": {"_id": {"$in": list(game_ids)}}}})
+
+
+RECOMMENDATION_PROJECTION = {"_id": 1, "name": 1, "tags": 1, "genres": 1, "price": 1, "positive_ratings": 1}
+
+
+def recommendation_args(args):
+    k = int(args.get('k', 10))
+    if not 0 < k <= SIMILARITY_TOP_K:
+        raise ValueError(f"'k' must be between 1 and {SIMILARITY_TOP_K}")
+    rank = args.get('rank', 'similarity')
+    if rank not in ('similarity', 'rating'):
+        raise ValueError(f"Invalid rank '{rank}'. Valid options are ['similarity', 'rating']")
+    filters = {RECOMMENDATION_FILTERS[arg]: value for arg, value in args.items() if arg in RECOMMENDATION_FILTERS}
+    return k, build_games_query(filters), rank
+
+
+# The _id and positive_ratings needed for ranking are always fetched and dropped again when fields= leaves them out
+def rank_recommendations(recommendations, scores, rank, k, projection=RECOMMENDATION_PROJECTION):
+    for recommendation in recommendations:
+        recommendation["score"] = scores[recommendation["_id"]]
+    if rank == 'rating':
+        recommendations.sort(key=lambda game: (game.get("positive_ratings", 0), game["score"]), reverse=True)
+    else:
+        recommendations.sort(key=lambda game: game["score"], reverse=True)
+    recommendations = recommendations[:k]
+    for recommendation in recommendations:
+        del recommendation["_id"]
+        if not projection.get("positive_ratings"):
+            recommendation.pop("positive_ratings", None)
+    return recommendations
+
 
 #http://127.0.0.1:5000/recommendations/Dota 2
+#http://127.0.0.1:5000/recommendations/Dota 2?k=5&genre=Action&max_price=10&rank=rating
 @app.route('/recommendations/<game_name>', methods=['GET'])
 def recommend_games(game_name):
+    try:
+        k, query, rank = recommendation_args(request.args)
+        projection = field_projection(request.args, RECOMMENDATION_PROJECTION)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     game = database.games.find_one(
-        {"name": {"$regex": f"^{game_name}$", "$options": "i"}},
-        {"_id": 0, "tags": 1, "genres": 1}
+        {"name": game_name},
+        {"_id": 1},
+        collation=CASE_INSENSITIVE
     )
 
     if not game:
         return jsonify({"error": "Game not found"}), 404
 
-    query = {
-        "$or": [
-            {"tags": {"$in": game["tags"]}},
-            {"genres": {"$in": game["genres"]}}
-        ],
-        "name": {"$ne": game_name}
-    }
+    entry = database.similar_games.find_one({"_id": game["_id"]})
+    if entry is None:
+        update_similarity([game["_id"]])
+        entry = database.similar_games.find_one({"_id": game["_id"]}) or {"neighbours": []}
+    scores = {neighbour["_id"]: neighbour["score"] for neighbour in entry["neighbours"]}
 
-    projection = {"_id": 0, "name": 1, "tags": 1, "genres": 1, "price": 1, "positive_ratings": 1}
+    query["_id"] = {"$in": list(scores)}
+    recommendations = list(database.games.find(query, dict(projection, _id=1, positive_ratings=1)))
+    return jsonify({"recommended_games": rank_recommendations(recommendations, scores, rank, k, projection)})
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+AUTOCOMPLETE_LIMIT = 10
+SEARCH_PROJECTION = {"_id": 0, "name": 1, "price": 1, "genres": 1, "tags": 1, "positive_ratings": 1}
+
+
+# The find arguments, page and page size of a search; one game more than the page is read to tell if there are more
+def search_request(args):
+    text = args.get('q', '').strip()
+    try:
+        page = int(args.get('page', 1))
+        limit = int(args.get('limit', SEARCH_PAGE_SIZE))
+    except ValueError as e:
+        raise ValueError(f"Invalid parameter: {e}")
+    if not text:
+        raise ValueError("Missing 'q' parameter")
+    if page < 1 or not 0 < limit <= SEARCH_MAX_PAGE_SIZE:
+        raise ValueError(f"'page' must be positive and 'limit' between 1 and {SEARCH_MAX_PAGE_SIZE}")
+
+    projection = dict(field_projection(args, SEARCH_PROJECTION), score={"$meta": "textScore"})
+    find_args = {"filter": {"$text": {"$search": text}}, "projection": projection,
+                 "sort": [("score", {"$meta": "textScore"})], "skip": (page - 1) * limit, "limit": limit + 1}
+    return find_args, page, limit
+
+
+# An anchored, case-sensitive regex on the lower-cased name is a range scan of the name_lower index
+def autocomplete_request(args):
+    prefix = args.get('prefix', '').strip().lower()
+    try:
+        limit = min(int(args.get('limit', AUTOCOMPLETE_LIMIT)), SEARCH_MAX_PAGE_SIZE)
+    except ValueError as e:
+        raise ValueError(f"Invalid parameter: {e}")
+    if not prefix:
+        raise ValueError("Missing 'prefix' parameter")
+    return {"filter": {"name_lower": {"$regex": f"^{re.escape(prefix)}"}}, "projection": {"_id": 0, "name": 1},
+            "sort": [("name_lower", pymongo.ASCENDING)], "limit": max(limit, 1)}
+
+
+#http://127.0.0.1:5000/search?q=zombie survival&page=2
+@app.route('/search', methods=['GET'])
+def search_games():
+    try:
+        find_args, page, limit = search_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    games = list(database.games.find(**find_args))
+    return jsonify({"games": games[:limit], "page": page, "has_more": len(games) > limit})
 
-    recommendations = list(database.games.aggregate([
-        {"$match": query},
-        {"$sample": {"size": 10}},
-        {"$project": projection}
-    ]))
 
-    return jsonify({"recommended_games": recommendations})
+#http://127.0.0.1:5000/search/autocomplete?prefix=counter
+@app.route('/search/autocomplete', methods=['GET'])
+def autocomplete_games():
+    try:
+        find_args = autocomplete_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"names": [game["name"] for game in database.games.find(**find_args)]})
 
 
 #http://127.0.0.1:5000/requirements/Counter-strike/windows
 @app.route('/requirements/<game_name>/<system>', methods=['GET'])
+@cached_route
 def get_system_requirements(game_name, system):
     valid_systems = ['windows', 'mac', 'linux']
     if system.lower() not in valid_systems:
         return jsonify({"error": f"Invalid system '{system}'. Valid options are {valid_systems}"}), 400
 
-    query = {"name": {"$regex": f"^{game_name}$", "$options": "i"}}
+    query = {"name": game_name}
     projection = {"_id": 0, f"{system.lower()}_requirements": 1, "name": 1}
-    game = database.games.find_one(query, projection)
+    game = database.games.find_one(query, projection, collation=CASE_INSENSITIVE)
 
     if not game:
         return jsonify({"error": f"Game '{game_name}' not found"}), 404
@@ -131,36 +1686,100 @@ def get_system_requirements(game_name, system):
         "requirements": requirements
     })
 
+
+RUNS_ON_ARGS = ["system", "level", "ram_gb", "storage_gb", "gpu_memory_gb"]
+
+
+# $elemMatch on system_requirements for a machine with the given system and capacities: the
+# games whose requirements at that level are known and fit, served by the system_requirements index
+def runs_on_requirement(args):
+    system = args.get('system', '').lower()
+    if system not in REQUIREMENT_SYSTEMS:
+        raise ValueError(f"Invalid system '{system}'. Valid options are {list(REQUIREMENT_SYSTEMS)}")
+    level = args.get('level', 'minimum')
+    if level not in REQUIREMENT_LEVELS:
+        raise ValueError(f"Invalid level '{level}'. Valid options are {REQUIREMENT_LEVELS}")
+    requirement = {"system": system, "level": level}
+    for field in REQUIREMENT_SIZE_PATTERNS:
+        if field in args:
+            try:
+                requirement[field] = {"$lte": float(args[field])}
+            except ValueError:
+                raise ValueError(f"Invalid value '{args[field]}' for '{field}', expected a number of GB")
+    return requirement
+
+
+#http://127.0.0.1:5000/games/runs-on?system=linux&ram_gb=4
+#http://127.0.0.1:5000/games/runs-on?system=windows&level=recommended&ram_gb=8&gpu_memory_gb=2&genres=Action
+@app.route('/games/runs-on', methods=['GET'])
+def games_runs_on():
+    try:
+        projection = dict(field_projection(request.args, GAMES_PROJECTION))
+        requirement = runs_on_requirement(request.args)
+        query = build_games_query({key: value for key, value in request.args.to_dict().items()
+                                   if key not in RUNS_ON_ARGS})
+        query["system_requirements"] = {"$elemMatch": requirement}
+        projection["system_requirements"] = {"$elemMatch": {"system": requirement["system"],
+                                                            "level": requirement["level"]}}
+        games, next_cursor = paginate_games(query, request.args, projection)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"games": games, "after": next_cursor})
+
 @app.route('/games/<game_id>', methods=['PUT'])
 def edit_game(game_id):
+    try:
+        game_id = int(game_id)
+    except ValueError:
+        return jsonify({"error": f"Invalid game ID '{game_id}'"}), 400
     data = request.get_json()
-
-    game = database.games.find_one({"_id": int(game_id)})
-    if not game:
-        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+    error = field_validation_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+    data = add_derived_fields(data)
 
     try:
-        database.games.update_one({"_id": int(game_id)}, {"$set": data})
-        return jsonify({"message": "Game updated successfully"}), 200
+        game = database.games.find_one_and_update({"_id": game_id}, {"$set": data},
+                                                  return_document=ReturnDocument.BEFORE)
     except Exception as e:
         return jsonify({"error": f"Failed to update game: {str(e)}"}), 500
-
-@app.route('/games/<game_id>', methods=['DELETE'])
-def delete_game(game_id):
-    game = database.games.find_one({"_id": int(game_id)})
     if not game:
         return jsonify({"error": f"Game with ID {game_id} not found"}), 404
 
+    update_reports(removed=[game], added=[dict(game, **data)])
+    if any(field in data for field in REQUIREMENT_SYSTEMS.values()):
+        refresh_system_requirements([game["_id"]])
+    if "wilson_score" not in data and ("positive_ratings" in data or "negative_ratings" in data):
+        refresh_wilson_scores([game["_id"]])
+    if any(field in data for field in LEADERBOARD_FIELDS):
+        update_leaderboards(removed=[game], added=[dict(game, **data)])
+    response_cache.invalidate(data.keys())
+    games_changed.set()
+    if "genres" in data or "tags" in data:
+        update_similarity([game["_id"]])
+    return jsonify({"message": "Game updated successfully"}), 200
+
+@app.route('/games/<game_id>', methods=['DELETE'])
+def delete_game(game_id):
+    try:
+        game_id = int(game_id)
+    except ValueError:
+        return jsonify({"error": f"Invalid game ID '{game_id}'"}), 400
     try:
-        database.games.delete_one({"_id": int(game_id)})
-        return jsonify({"message": f"Game with ID {game_id} deleted successfully"}), 200
+        game = database.games.find_one_and_delete({"_id": game_id})
     except Exception as e:
         return jsonify({"error": f"Failed to delete game: {str(e)}"}), 500
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
 
-@app.route('/games', methods=['POST'])
-def add_game():
-    data = request.get_json()
+    update_reports(removed=[game])
+    update_leaderboards(removed=[game])
+    response_cache.invalidate()
+    games_changed.set()
+    remove_from_similarity([game["_id"]])
+    return jsonify({"message": f"Game with ID {game_id} deleted successfully"}), 200
 
+def game_validation_error(data):
     required_fields = [
         "name", "release_date", "developer", "platforms", "categories",
         "genres", "tags", "positive_ratings", "negative_ratings", "price",
@@ -170,422 +1789,489 @@ def add_game():
     missing_fields = [field for field in required_fields if field not in data]
 
     if missing_fields:
-        return jsonify({"error": f"Missing fields: {missing_fields}"}), 400
+        return f"Missing fields: {missing_fields}"
+    return field_validation_error(data)
 
+
+# Checks the URL and requirement fields that are present, so it also applies to partial updates
+def field_validation_error(data):
     url_fields = ["header_img", "website", "support_url", "background_img"]
     for field in url_fields:
-        if data.get(field) and not re.match(r'https?://', data[field]):
-            return jsonify({"error": f"Invalid URL for field '{field}': {data[field]}"}), 400
+        if data.get(field) and not re.match(r'https?://', str(data[field])):
+            return f"Invalid URL for field '{field}': {data[field]}"
 
     requirements_fields = ["linux_requirements", "mac_requirements", "windows_requirements"]
     for field in requirements_fields:
         if not isinstance(data.get(field, ""), str):
-            return jsonify({"error": f"Field '{field}' must be a string."}), 400
+            return f"Field '{field}' must be a string."
+    return None
+
+
+@app.route('/games', methods=['POST'])
+def add_game():
+    data = request.get_json()
+
+    error = game_validation_error(data)
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
-        database.games.insert_one(data)
-        return jsonify({"message": "Game added successfully"}), 201
+        database.games.insert_one(add_derived_fields(data))
     except Exception as e:
         return jsonify({"error": f"Failed to add game: {str(e)}"}), 500
 
+    update_reports(added=[data])
+    update_leaderboards(added=[data])
+    response_cache.invalidate()
+    games_changed.set()
+    update_similarity([data["_id"]])
+    return jsonify({"message": "Game added successfully"}), 201
+
+
+BULK_BATCH_SIZE = 1000
+BULK_OPERATIONS = ["insert", "upsert", "update", "delete"]
+REPORT_FIELDS = dict(LEADERBOARD_FIELDS, price=1)
+
+
+def parse_bulk_items(mimetype, body):
+    if mimetype == 'application/x-ndjson':
+        items = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    items.append({"error": f"Invalid JSON line: {e}"})
+        return items
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array or NDJSON of operations")
+    return items
+
+
+def run_bulk(items):
+    results = []
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        results.extend(run_bulk_batch(items[start:start + BULK_BATCH_SIZE], start))
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("ok", "not_found", "error")}
+    return {"results": results, **counts}
+
+
+# Turns one bulk item into (game _id, write model, new fields or game) or raises ValueError
+def bulk_operation(item):
+    if not isinstance(item, dict):
+        raise ValueError("Each operation must be an object")
+    if "error" in item:
+        raise ValueError(item["error"])
+    op = item.get("op")
+    if op not in BULK_OPERATIONS:
+        raise ValueError(f"Invalid op '{op}'. Valid options are {BULK_OPERATIONS}")
+
+    if op in ("insert", "upsert"):
+        game = item.get("game")
+        if not isinstance(game, dict):
+            raise ValueError(f"'{op}' needs a 'game' object")
+        error = game_validation_error(game)
+        if error:
+            raise ValueError(error)
+        game = add_derived_fields(dict(game))
+        if "_id" in item:
+            game["_id"] = int(item["_id"])
+        if op == "insert":
+            return game.get("_id"), InsertOne(game), game
+        if "_id" not in game:
+            raise ValueError("'upsert' needs an '_id'")
+        return game["_id"], ReplaceOne({"_id": game["_id"]}, game, upsert=True), game
+
+    if "_id" not in item:
+        raise ValueError(f"'{op}' needs an '_id'")
+    game_id = int(item["_id"])
+    if op == "update":
+        fields = item.get("fields")
+        if not isinstance(fields, dict) or not fields or "_id" in fields:
+            raise ValueError("'update' needs a non-empty 'fields' object without '_id'")
+        error = field_validation_error(fields)
+        if error:
+            raise ValueError(error)
+        fields = add_derived_fields(dict(fields))
+        return game_id, UpdateOne({"_id": game_id}, {"$set": fields}), fields
+    return game_id, DeleteOne({"_id": game_id}), None
+
+
+# Runs one batch of bulk items as a single bulk_write and keeps the report counters and
+# similarity index in step with the writes that succeeded
+def run_bulk_batch(items, offset):
+    results = []
+    planned = []
+    for i, item in enumerate(items):
+        op = item.get("op") if isinstance(item, dict) else None
+        try:
+            game_id, model, change = bulk_operation(item)
+        except (ValueError, TypeError) as e:
+            results.append({"index": offset + i, "op": op, "status": "error", "error": str(e)})
+            continue
+        results.append({"index": offset + i, "op": op, "_id": game_id, "status": "ok"})
+        planned.append((len(results) - 1, op, game_id, model, change))
+
+    ids = [game_id for _, _, game_id, _, _ in planned if game_id is not None]
+    current = {game["_id"]: game for game in database.games.find({"_id": {"$in": ids}}, REPORT_FIELDS)}
+    initial = dict(current)
+
+    operations = []
+    existing = set(current)
+    for position, op, game_id, model, change in planned:
+        if op in ("update", "delete") and game_id not in existing:
+            results[position].update(status="not_found")
+            continue
+        if op == "delete":
+            existing.discard(game_id)
+        elif game_id is not None:
+            existing.add(game_id)
+        operations.append((position, op, game_id, model, change))
+
+    # Writes to the same _id must keep their order, so its n-th write goes into the n-th unordered bulk_write
+    rounds = []
+    writes_per_id = {}
+    for operation in operations:
+        game_id = operation[2]
+        n = writes_per_id[game_id] = writes_per_id.get(game_id, -1) + 1 if game_id is not None else 0
+        if n == len(rounds):
+            rounds.append([])
+        rounds[n].append(operation)
+
+    removed, added, similar, deleted, requirements, rescored, written = [], [], [], [], [], [], set()
+    for batch in rounds:
+        failed = {}
+        try:
+            database.games.bulk_write([model for _, _, _, model, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+        except PyMongoError as e:
+            failed = dict.fromkeys(range(len(batch)), str(e))
+
+        for i, (position, op, game_id, model, change) in enumerate(batch):
+            if i in failed:
+                results[position].update(status="error", error=failed[i])
+                continue
+            old = current.get(game_id)
+            # The game is missing when an earlier write to its _id in this batch failed
+            if op in ("update", "delete") and old is None:
+                results[position].update(status="not_found")
+                continue
+            if op == "insert":
+                game_id = change["_id"]
+                results[position]["_id"] = game_id if isinstance(game_id, (int, str)) else str(game_id)
+            new = None if op == "delete" else change if op in ("insert", "upsert") else dict(old, **change)
+            written.add(game_id)
+            if old:
+                removed.append(old)
+            if new:
+                added.append(new)
+                current[game_id] = new
+                if op != "update" or "genres" in change or "tags" in change:
+                    similar.append(game_id)
+                if op == "update" and any(field in change for field in REQUIREMENT_SYSTEMS.values()):
+                    requirements.append(game_id)
+                if op == "update" and "wilson_score" not in change and (
+                        "positive_ratings" in change or "negative_ratings" in change):
+                    rescored.append(game_id)
+            else:
+                current.pop(game_id, None)
+                deleted.append(game_id)
+
+    update_reports(removed=removed, added=added)
+    if requirements:
+        refresh_system_requirements([game_id for game_id in requirements if game_id in current])
+    if rescored:
+        refresh_wilson_scores([game_id for game_id in rescored if game_id in current])
+    # Leaderboards take one version of each game, so they get the state before and after the whole batch
+    update_leaderboards(removed=[initial[game_id] for game_id in written if game_id in initial],
+                        added=[current[game_id] for game_id in written if game_id in current])
+    if deleted:
+        remove_from_similarity(deleted)
+    if similar:
+        update_similarity_later([game_id for game_id in similar if game_id in current])
+    return results
+
+
+#http://127.0.0.1:5000/games/bulk
+#[{"op": "insert", "game": {...}}, {"op": "update", "_id": 10, "fields": {"price": 4.99}}, {"op": "delete", "_id": 20}]
+@app.route('/games/bulk', methods=['POST'])
+def bulk_games():
+    try:
+        items = parse_bulk_items(request.mimetype, request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = run_bulk(items)
+    if result["ok"]:
+        response_cache.invalidate()
+        games_changed.set()
+    return jsonify(result), 200
+
+
+# Ad-hoc reports answered from the columnar snapshot of analytics.py, which is imported here on the
+# first query so that only workers that serve these queries load numpy
+#http://127.0.0.1:5000/reports/query?group_by=genre&metric=avg:positive_ratings
+#http://127.0.0.1:5000/reports/query?group_by=year,genre&metric=count&min_year=2010&sort=-value&limit=10
+#http://127.0.0.1:5000/reports/query?group_by=developer&metric=avg:price&genre=Indie
+@app.route('/reports/query', methods=['GET'])
+def report_query():
+    import analytics
+
+    try:
+        result = analytics.query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
 
 #http://127.0.0.1:5000/reports/top_genres_by_year
 @app.route('/reports/top_genres_by_year', methods=['GET'])
+@cached_route
 def top_genres_by_year():
-    pipeline = [
-        {"$unwind": "$genres"},
-        {
-            "$addFields": {
-                "release_year": {"$substr": ["$release_date", 0, 4]}
-            }
-        },
-        {
-            "$group": {
-                "_id": {"year": "$release_year", "genre": "$genres"},
-                "average_rating": {"$avg": "$positive_ratings"}
-            }
-        },
-        {"$sort": {"average_rating": -1}},
-        {"$limit": 10}
-    ]
-    result = list(database.games.aggregate(pipeline))
-    return jsonify(result)
+    return jsonify(read_report("top_genres_by_year"))
 
 
 #http://127.0.0.1:5000/reports/developer_genre_ratings
 @app.route('/reports/developer_genre_ratings', methods=['GET'])
+@cached_route
 def developer_genre_ratings():
-    pipeline = [
-        {
-            "$group": {
-                "_id": {"developer": "$developer", "genre": "$genres"},
-                "average_rating": {"$avg": "$positive_ratings"}
-            }
-        },
-        {"$sort": {"_id.developer": 1, "_id.genre": 1}},
-        {"$limit": 50}
-    ]
-    result = list(database.games.aggregate(pipeline))
-    return jsonify(result)
-
-
-@app.route('/games/bulk_update_price', methods=['PUT'])
-def bulk_update_price():
-    data = request.form or request.json
-    developer = data.get('developer')
-    discount_percentage = float(data.get('discount_percentage', 10)) / 100
-
-    if not developer:
-        return jsonify({"error": "Missing 'developer' parameter"}), 400
+    return jsonify(read_report("developer_genre_ratings"))
 
-    print(f"Developer received: {developer}")
 
-    games = list(
-        database.games.find({"developer": {"$regex": f"^{developer}$", "$options": "i"}}, {"_id": 1, "price": 1}))
-    print(f"Developer: {developer}, Games found: {len(games)}")
+def bulk_price_query(data):
+    developers = data.getlist('developer') if hasattr(data, 'getlist') else data.get('developer')
+    if isinstance(developers, str):
+        developers = [developers]
+    developers = [developer for developer in developers or [] if developer]
 
-    if not games:
-        return jsonify({"error": f"No games found for developer '{developer}'"}), 404
+    filters = data.get('filter') or {}
+    if not isinstance(filters, dict):
+        raise ValueError("'filter' must be an object of /games filters")
+    query = build_games_query(filters)
+    if developers:
+        query.setdefault("developer", {})["$in"] = developers
+    # A game without a price would get PRICE_FLOOR from discounted_price
+    query.setdefault("price", {})["$type"] = "number"
+    return query
 
-    for game in games:
-        new_price = max(game['price'] * (1 - discount_percentage), 0.99)
-        database.games.update_one({"_id": game["_id"]}, {"$set": {"price": new_price}})
-
-    return jsonify({"message": f"Prices updated for {len(games)} games"}), 200
 
-import webbrowser
+def discounted_price(discount_percentage):
+    return {"$max": [{"$multiply": ["$price", 1 - discount_percentage]}, PRICE_FLOOR]}
 
-#http://127.0.0.1:5000/games/10/header_img
-@app.route('/games/<game_id>/header_img', methods=['GET'])
-def open_header_img(game_id):
-    game = database.games.find_one({"_id": int(game_id)}, {"_id": 0, "header_img": 1, "name": 1})
-    if not game:
-        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
 
-    header_img = game.get("header_img", "No Data Available")
-    if header_img == "No Data Available":
-        return jsonify({"error": f"Header image for game '{game_id}' is not available"}), 404
+# Price totals per release year before and after the discount, for the dry run and for price_trend
+def price_totals_pipeline(query, discount_percentage):
+    return [
+        {"$match": query},
+        {"$group": {"_id": "$release_year", "count": {"$sum": 1},
+                    "old_price": {"$sum": "$price"}, "new_price": {"$sum": discounted_price(discount_percentage)}}}
+    ]
 
-    webbrowser.open(header_img)
-    return jsonify({"message": f"Opened header image for game '{game_id}' in the browser", "header_img": header_img}), 200
 
-#http://127.0.0.1:5000/games/30/website
-@app.route('/games/<game_id>/website', methods=['GET'])
-def open_website(game_id):
-    game = database.games.find_one({"_id": int(game_id)}, {"_id": 0, "website": 1, "name": 1})
-    if not game:
-        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
+def price_totals_changes(totals):
+    removed = [{"release_year": total["_id"], "price": total["old_price"]} for total in totals]
+    added = [{"release_year": total["_id"], "price": total["new_price"]} for total in totals]
+    return removed, added
 
-    website = game.get("website", "No Data Available")
-    if website == "No Data Available":
-        return jsonify({"error": f"Website for game '{game_id}' is not available"}), 404
 
-    webbrowser.open(website)
-    return jsonify({"message": f"Opened website for game '{game_id}' in the browser", "website": website}), 200
+#http://127.0.0.1:5000/games/bulk_update_price
+#{"developer": ["Valve", "Ubisoft"], "discount_percentage": 20, "filter": {"min_price": 10}, "dry_run": true}
+@app.route('/games/bulk_update_price', methods=['PUT'])
+def bulk_update_price():
+    data = request.form or request.json or {}
+    try:
+        query = bulk_price_query(data)
+        discount_percentage = float(data.get('discount_percentage', 10)) / 100
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    dry_run = str(data.get('dry_run', '')).lower() in ('1', 'true')
 
+    if not query:
+        return jsonify({"error": "Missing 'developer' or 'filter' parameter"}), 400
 
+    collation = query_collation(query)
+    totals = list(database.games.aggregate(price_totals_pipeline(query, discount_percentage), collation=collation))
+    matched = sum(total["count"] for total in totals)
+    price_delta = sum(total["new_price"] - total["old_price"] for total in totals)
 
+    if not matched:
+        return jsonify({"error": "No games found matching the criteria"}), 404
+    if dry_run:
+        return jsonify({"dry_run": True, "matched": matched, "price_delta": price_delta}), 200
 
-def clean_from_tags(cleaned_string):
+    result = database.games.update_many(query, [{"$set": {"price": discounted_price(discount_percentage)}}],
+                                        collation=collation)
+    update_reports(*price_totals_changes(totals))
+    response_cache.invalidate({"price"})
+    games_changed.set()
 
-    cleaned_string = re.sub(r'[\n\t\r]', '', cleaned_string)
-    cleaned_string = re.sub(r'\\n', '', cleaned_string)
-    cleaned_string = re.sub(r'\\t', '', cleaned_string)
-    cleaned_string = re.sub(r'\\r', '', cleaned_string)
-    cleaned_string = re.sub(r'\'', ' ', cleaned_string)
-    cleaned_string = re.sub(r'{', ' ', cleaned_string)
-    cleaned_string = re.sub(r'}', ' ', cleaned_string)
-    cleaned_string = re.sub(r' minimum: ', ' ', cleaned_string, count=cleaned_string.count("minimum:") - 1).strip()
-    cleaned_string = re.sub(r'\s+', ' ', cleaned_string)
-    return cleaned_string
+    return jsonify({
+        "message": f"Prices updated for {result.modified_count} games",
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "price_delta": price_delta,
+    }), 200
+
+# The header and background images, served from the local media cache of media.py (imported here on
+# first use, like analytics.py). Until an image is cached the request is redirected to its origin URL
+# and the download is queued; cached images carry their content hash as ETag and support Range requests.
+#http://127.0.0.1:5000/games/10/header_img
+#http://127.0.0.1:5000/games/10/background_img?width=460
+@app.route('/games/<int:game_id>/<any(header_img, background_img):field>', methods=['GET'])
+def get_game_image(game_id, field):
+    import media
 
+    try:
+        width = media.image_width(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    game = database.games.find_one({"_id": game_id}, {"_id": 0, field: 1})
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
 
-def clean_game_document(game):
-    field_defaults = {
-        "name": "Unknown Game",
-        "release_date": "Unknown Date",
-        "developer": "Unknown Developer",
-        "platforms": [],
-        "categories": [],
-        "genres": [],
-        "tags": [],
-        "positive_ratings": 0,
-        "negative_ratings": 0,
-        "price": 0.0,
-        "detailed_description": "No description available",
-    }
+    url = game.get(field)
+    if not isinstance(url, str) or not re.match(r'https?://', url):
+        return jsonify({"error": f"Image '{field}' for game '{game_id}' is not available"}), 404
+    entry = media.cached_image(url, width)
+    if entry is None:
+        return redirect(url)
+    # Another process may evict the file between the index lookup and here
+    try:
+        return send_file(entry["path"], mimetype=entry["mimetype"], etag=entry["digest"], max_age=media.MEDIA_MAX_AGE)
+    except FileNotFoundError:
+        return redirect(url)
 
-    for key, default in field_defaults.items():
-        if key in game:
-            value = game[key]
-            if isinstance(value, (list, np.ndarray, pd.Series)):
-                if len(value) == 0:
-                    game[key] = default
-            elif pd.isna(value):
-                game[key] = default
-        else:
-            game[key] = default
-    return game
+#http://127.0.0.1:5000/games/30/website
+@app.route('/games/<int:game_id>/website', methods=['GET'])
+def get_game_website(game_id):
+    game = database.games.find_one({"_id": game_id}, {"_id": 0, "website": 1})
+    if not game:
+        return jsonify({"error": f"Game with ID {game_id} not found"}), 404
 
+    website = game.get("website")
+    if not isinstance(website, str) or not re.match(r'https?://', website):
+        return jsonify({"error": f"Website for game '{game_id}' is not available"}), 404
+    return redirect(website)
+
+#http://127.0.0.1:5000/media/stats
+@app.route('/media/stats', methods=['GET'])
+def media_stats():
+    import media
+
+    return jsonify(media.stats())
+
+
+
+
+GAMES_INDEXES = [
+    {"name": "name_ci", "keys": [("name", pymongo.ASCENDING)], "collation": CASE_INSENSITIVE},
+    {"name": "developer_ci", "keys": [("developer", pymongo.ASCENDING)], "collation": CASE_INSENSITIVE},
+    {"name": "genres", "keys": [("genres", pymongo.ASCENDING)]},
+    {"name": "tags", "keys": [("tags", pymongo.ASCENDING)]},
+    {"name": "price", "keys": [("price", pymongo.ASCENDING)]},
+    {"name": "positive_ratings", "keys": [("positive_ratings", pymongo.ASCENDING)]},
+    {"name": "name_lower", "keys": [("name_lower", pymongo.ASCENDING)]},
+    {"name": "system_requirements", "keys": [("system_requirements.system", pymongo.ASCENDING),
+                                             ("system_requirements.level", pymongo.ASCENDING),
+                                             ("system_requirements.ram_gb", pymongo.ASCENDING),
+                                             ("system_requirements.storage_gb", pymongo.ASCENDING),
+                                             ("system_requirements.gpu_memory_gb", pymongo.ASCENDING)]},
+    # Leaderboard refills: the games of one key in score order, read as an index range without a sort.
+    # The developer key is matched exactly, so that index has no collation.
+    *({"name": f"leaderboard_{field}", "keys": [(field, pymongo.ASCENDING), ("wilson_score", pymongo.DESCENDING),
+                                                 ("_id", pymongo.ASCENDING)]}
+      for field in ["genres", "tags", "developer", "release_year"]),
+    {"name": "search_text", "keys": [("name", pymongo.TEXT), ("tags", pymongo.TEXT), ("detailed_description", pymongo.TEXT)],
+     "weights": {"name": 10, "tags": 5, "detailed_description": 1}, "default_language": "english"},
+]
+
+
+def ensure_indexes():
+    models = [IndexModel(index["keys"], **{k: v for k, v in index.items() if k != "keys"}) for index in GAMES_INDEXES]
+    created = database.games.create_indexes(models)
+    ensure_report_indexes()
+    ensure_leaderboard_indexes()
+    print(f"Indexes ensured on games: {created}")
+    return created
+
+
+# Representative query of each route, used to check that they are served by an index
+def route_queries():
+    sample = database.games.find_one({}, {"name": 1, "developer": 1, "genres": 1, "tags": 1, "release_year": 1}) or {}
+    name = sample.get("name", "Dota 2")
+    developer = sample.get("developer", "Valve")
+    genre = (sample.get("genres") or ["Action"])[0]
+    leaderboard_keys = {"genre": genre, "tag": (sample.get("tags") or ["Indie"])[0], "developer": developer,
+                        "year": sample.get("release_year", 2018)}
+    return [
+        ("GET /games?genres=<genre>&sort=-positive_ratings",
+         {"filter": {"genres": {"$eq": genre}}, "sort": [("positive_ratings", -1), ("_id", -1)], "limit": 51}),
+        ("GET /games?name=<name>",
+         {"filter": {"name": {"$eq": name}}, "sort": [("_id", 1)], "limit": 51, "collation": CASE_INSENSITIVE}),
+        ("GET /games/facets?genres=<genre>", {"filter": {"genres": {"$eq": genre}}}),
+        ("GET /games/export", {"filter": {"price": {"$gte": 5.0, "$lte": 10.0}}, "sort": [("_id", 1)]}),
+        ("GET /recommendations/<name>", {"filter": {"name": name}, "limit": 1, "collation": CASE_INSENSITIVE}),
+        ("GET /requirements/<name>/<system>", {"filter": {"name": name}, "limit": 1, "collation": CASE_INSENSITIVE}),
+        ("GET /games/runs-on?system=linux&ram_gb=4",
+         {"filter": {"system_requirements": {"$elemMatch": {"system": "linux", "level": "minimum", "ram_gb": {"$lte": 4.0}}}},
+          "sort": [("_id", 1)], "limit": 51}),
+        *((f"PUT /games/<id> (refill of a {dimension} leaderboard)",
+           {"filter": {LEADERBOARD_DIMENSIONS[dimension]: key, "wilson_score": {"$type": "number"}},
+            "sort": [("wilson_score", -1), ("_id", 1)], "limit": LEADERBOARD_SIZE})
+          for dimension, key in leaderboard_keys.items()),
+        ("PUT /games/bulk_update_price", {"filter": {"developer": developer}, "collation": CASE_INSENSITIVE}),
+    ]
 
-def create_steam_db():
-    dataset = ['steam.csv', 'steam_description_data.csv', 'steam_media_data.csv', 'steam_requirements_data.csv',
-               'steam_support_info.csv', 'steamspy_tag_data.csv']
-
-    sources = {}
-    for source in dataset:
-        df = pd.read_csv(source)
-        pd.options.display.max_columns = len(df.columns)
-        display(df.head(3))
-        print(source)
-        sources[source] = df
-
-
-
-    games_validator = \
-        {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": [
-                    "name",
-                    "release_date",
-                    "developer",
-                    "platforms",
-                    "categories",
-                    "genres",
-                    "tags",
-                    "positive_ratings",
-                    "negative_ratings",
-                    "price",
-                    "website",
-                    "support_url",
-                    "header_img",
-                    "background_img",
-                    "detailed_description",
-                    "linux_requirements",
-                    "windows_requirements",
-                    "mac_requirements"
-                ],
-                "properties": {
-                    "name": {
-                        "bsonType": "string",
-                        "description": "The name of the game."
-                    },
-                    "release_date": {
-                        "bsonType": "string",
-                        "description": "The release date of the game in string format."
-                    },
-                    "developer": {
-                        "bsonType": "string",
-                        "description": "The developer of the game."
-                    },
-                    "platforms": {
-                        "bsonType": "array",
-                        "items": {
-                            "bsonType": "string"
-                        },
-                        "description": "The platforms the game is available on (e.g., Windows, Mac, Linux)."
-                    },
-                    "categories": {
-                        "bsonType": "array",
-                        "items": {
-                            "bsonType": "string"
-                        },
-                        "description": "The categories of the game."
-                    },
-                    "genres": {
-                        "bsonType": "array",
-                        "items": {
-                            "bsonType": "string"
-                        },
-                        "description": "The genres of the game."
-                    },
-                    "tags": {
-                        "bsonType": "array",
-                        "items": {
-                            "bsonType": "string"
-                        },
-                        "description": "Tags associated with the game."
-                    },
-                    "positive_ratings": {
-                        "bsonType": "int",
-                        "minimum": 0,
-                        "description": "The number of positive ratings for the game."
-                    },
-                    "negative_ratings": {
-                        "bsonType": "int",
-                        "minimum": 0,
-                        "description": "The number of negative ratings for the game."
-                    },
-                    "price": {
-                        "bsonType": "double",
-                        "minimum": 0,
-                        "description": "The price of the game."
-                    },
-                    "website": {
-                        "bsonType": "string",
-                        "description": "Url of the website about the game"
-                    },
-                    "support_url": {
-                        "bsonType": "string",
-                        "description": "Url to the steam support page"
-                    },
-                    "header_img": {
-                        "bsonType": "string",
-                        "description": "Url to the header image of the game."
-                    },
-                    "background_img": {
-                        "bsonType": "string",
-                        "description": "Url to the background image of the game."
-                    },
-                    "detailed_description": {
-                        "bsonType": "string",
-                        "description": "Detailed description of the game."
-                    },
-                    "linux_requirements": {
-                        "bsonType": "string",
-                        "description": "Linux system requirements for the game."
-                    },
-                    "windows_requirements": {
-                        "bsonType": "string",
-                        "description": "Windows system requirements for the game."
-                    },
-                    "mac_requirements": {
-                        "bsonType": "string",
-                        "description": "Mac system requirements for the game."
-                    }
-                }
-            }
-        }
 
-    col_games = database.create_collection("games", validator=games_validator)
-
-    s = sources['steam_description_data.csv']
-
-    detailed_descriptions = {}
-
-
-    for _, record in s.iterrows():
-        if record['steam_appid'] not in detailed_descriptions.keys():
-            des = str(record['detailed_description'])
-            soup = BeautifulSoup(des, 'html.parser')
-            cleaned_string = soup.get_text()
-            detailed_descriptions[record['steam_appid']]=cleaned_string
-
-
-    s = sources['steam_requirements_data.csv']
-
-    pc_requirements = {}
-    mac_requirements = {}
-    linux_requirements = {}
-    minimum = {}
-    for _, record in s.iterrows():
-        appid = record['steam_appid']
-        pc_requirements[appid] = clean_from_tags(
-            BeautifulSoup(str(record.get('pc_requirements', "No Data Available")).lower(), 'html.parser').get_text()
-        )
-        mac_requirements[appid] = clean_from_tags(
-            BeautifulSoup(str(record.get('mac_requirements', "No Data Available")).lower(), 'html.parser').get_text()
-        )
-        linux_requirements[appid] = clean_from_tags(
-            BeautifulSoup(str(record.get('linux_requirements', "No Data Available")).lower(), 'html.parser').get_text()
-        )
-
-    s=sources['steam_support_info.csv']
-    website={}
-    support_url={}
-    for _, record in s.iterrows():
-        appid = record['steam_appid']
-        website[appid] = record['website']
-        support_url[appid] = record['support_url']
-
-    s=sources['steam_media_data.csv']
-    header_img={}
-    background_img={}
-    for _,record in s.iterrows():
-        appid = record['steam_appid']
-        header_img[appid] = record['header_image']
-        background_img[appid] = record['background']
-
-
-
-
-
-    s = sources['steam.csv']
-
-    game = {}
-
-    for index, record in s.iterrows():
-        game['_id']=record['appid']
-        game['name'] = record['name']
-        game['release_date'] = record['release_date']
-        game['developer'] = record['developer']
-        game['platforms'] = []
-        game['categories'] = []
-        game['genres'] = []
-        game['tags'] = []
-        game['positive_ratings'] = record['positive_ratings']
-        game['negative_ratings'] = record['negative_ratings']
-        game['price'] = record['price']
-
-        for i in record['platforms'].split(';'):
-            game['platforms'].append(i)
-        for c in record['categories'].split(';'):
-            game['categories'].append(c)
-        for g in record['genres'].split(';'):
-            game['genres'].append(g)
-        for t in record['steamspy_tags'].split(';'):
-            game['tags'].append(t)
-
-        if record['appid'] in website.keys():
-            game['website'] = str(website[record['appid']])
-        else:
-            game['website'] = 'No Data Available'
-        if game['website']=="nan":
-            game['website'] = "No Data Available"
-        if record['appid'] in support_url.keys():
-            game['support_url'] = str(support_url[record['appid']])
-        else:
-            game['support_url'] = 'No Data Available'
-        if game['support_url']=="nan":
-            game['support_url'] = "No Data Available"
+def plan_stages(plan):
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        inputs = plan.get("inputStages") or [plan.get("inputStage")]
+        plan = inputs[0]
+    return " <- ".join(stages)
 
-        if record['appid'] in header_img.keys():
-            game['header_img'] = str(header_img[record['appid']])
-        else:
-            game['header_img'] = "No Data Available"
-        if record['appid'] in background_img.keys():
-            game['background_img'] = str(background_img[record['appid']])
-        else:
-            game['background_img'] = "No Data Available"
-        game['detailed_description'] = str(detailed_descriptions[record['appid']])
-        if record['appid'] in minimum.keys():
-            game['minimum'] = str(minimum[record['appid']])
-        game['linux_requirements']= linux_requirements.get(record['appid'], "No Data Available")
-        if game['linux_requirements']=="[]":
-            game['linux_requirements'] = 'No Data Available'
-        game['windows_requirements']= pc_requirements.get(record['appid'], "No Data Available")
-        if game['windows_requirements']=="[]":
-            game['windows_requirements'] = 'No Data Available'
-        game['mac_requirements']= mac_requirements.get(record['appid'], "No Data Available")
-        if game['mac_requirements']=="[]":
-            game['mac_requirements'] = 'No Data Available'
 
-        game = clean_game_document(game)
-        col_games.insert_one(game)
-        game = {}
+def explain_routes():
+    for route, query in route_queries():
+        cursor = database.games.find(query["filter"], sort=query.get("sort"), limit=query.get("limit", 0),
+                                     collation=query.get("collation"))
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        print(f"{route}\n    {plan_stages(winning_plan.get('queryPlan', winning_plan))}")
 
 
+COMMANDS = {
+    "indexes": ensure_indexes,
+    "explain": explain_routes,
+    "rebuild-reports": rebuild_reports,
+    "rebuild-leaderboards": rebuild_leaderboards,
+    "backfill": backfill_derived_fields,
+}
 
 
 def main():
-    try:
-        create_steam_db()
-    except Exception as e:
-        print(f"Database already exists or caught error:{e}")
+    if len(sys.argv) > 1:
+        command = COMMANDS.get(sys.argv[1])
+        if command is None:
+            print(f"Unknown command '{sys.argv[1]}'. Valid options are {list(COMMANDS)}")
+            sys.exit(2)
+        command()
+        return
+
+    # Loading and syncing the CSVs is done by ingest.py, which keeps pandas and friends out of the server
+    ensure_indexes()
+    app.run(debug=True)
 
 
 
 if __name__ == '__main__':
     main()
-    app.run(debug=True)
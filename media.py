@@ -0,0 +1,332 @@
+import hashlib
+import io
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+import main
+
+# Optional: Pillow resizes the images to the widths of MEDIA_WIDTHS; without it only the originals are served
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Local copies of the header and background images of the games. The bytes are stored once per
+# content hash under MEDIA_DIR, and a sqlite index maps (url, width) to the hash and keeps the last
+# use of every entry, so the least recently used ones are evicted once the directory passes
+# MEDIA_CACHE_MAX_MB. A miss is answered with a redirect to the origin while a bounded pool of
+# background threads downloads (and resizes) the image for the next request.
+#   python media.py prefetch [limit]
+
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "media_cache")
+MEDIA_CACHE_MAX_MB = float(os.environ.get("MEDIA_CACHE_MAX_MB", 1024))
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", 4))
+MEDIA_QUEUE_SIZE = int(os.environ.get("MEDIA_QUEUE_SIZE", 1000))
+MEDIA_FETCH_TIMEOUT = float(os.environ.get("MEDIA_FETCH_TIMEOUT", 10))
+MEDIA_MAX_BYTES = 10 * 1024 * 1024
+# Hosts the images are downloaded from; '*' allows any. Other URLs are only redirected to.
+MEDIA_ALLOWED_HOSTS = set(os.environ.get(
+    "MEDIA_ALLOWED_HOSTS",
+    "steamcdn-a.akamaihd.net,cdn.akamai.steamstatic.com,shared.akamai.steamstatic.com,cdn.cloudflare.steamstatic.com",
+).split(","))
+MEDIA_FIELDS = ["header_img", "background_img"]
+MEDIA_WIDTHS = [184, 460, 920]
+MEDIA_MIMETYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+MEDIA_MAX_AGE = 86400
+# A URL whose download failed is not queued again for this long
+MEDIA_RETRY_SECONDS = float(os.environ.get("MEDIA_RETRY_SECONDS", 300))
+# Last-use times are only rewritten when older than this, so that hits rarely write to the index
+MEDIA_TOUCH_SECONDS = 60
+
+
+def downloadable(url):
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme in ("http", "https") and ("*" in MEDIA_ALLOWED_HOSTS or parts.hostname in MEDIA_ALLOWED_HOSTS)
+
+
+def image_width(args):
+    width = args.get("width")
+    if width is None:
+        return None
+    if not width.isdigit() or int(width) not in MEDIA_WIDTHS:
+        raise ValueError(f"Invalid width '{width}'. Valid options are {MEDIA_WIDTHS}")
+    return int(width)
+
+
+class MediaCache:
+    def __init__(self, directory=MEDIA_DIR, max_bytes=MEDIA_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    # One connection per thread; the index is shared by every server process through sqlite's locking
+    def index(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS media (key TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                               "mimetype TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS media_used ON media (used)")
+            connection.execute("CREATE INDEX IF NOT EXISTS media_digest ON media (digest)")
+            self.local.connection = connection
+        return connection
+
+    def path(self, digest, mimetype):
+        return os.path.join(self.directory, digest[:2], digest + MEDIA_MIMETYPES[mimetype])
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def get(self, url, width=None):
+        key = f"{url}@{width}" if width else url
+        index = self.index()
+        row = index.execute("SELECT digest, mimetype, size, used FROM media WHERE key = ?", (key,)).fetchone()
+        if row is not None and not os.path.exists(self.path(row[0], row[1])):
+            index.execute("DELETE FROM media WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            return None
+        now = time.time()
+        if row[3] < now - MEDIA_TOUCH_SECONDS:
+            index.execute("UPDATE media SET used = ? WHERE key = ?", (now, key))
+        return {"path": self.path(row[0], row[1]), "digest": row[0], "mimetype": row[1], "size": row[2]}
+
+    # The file is written before the index points at it, and renamed into place so readers never see part of it
+    def put(self, url, width, body, mimetype):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.path(digest, mimetype)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(body)
+            os.replace(temporary, path)
+        key = f"{url}@{width}" if width else url
+        self.index().execute("INSERT OR REPLACE INTO media (key, digest, mimetype, size, used) VALUES (?, ?, ?, ?, ?)",
+                             (key, digest, mimetype, len(body), time.time()))
+        self.evict()
+        return digest
+
+    def total_bytes(self, index):
+        return index.execute("SELECT COALESCE(SUM(size), 0) FROM "
+                             "(SELECT MAX(size) AS size FROM media GROUP BY digest)").fetchone()[0]
+
+    # Drops the least recently used entries, and the files no remaining entry points at, until under max_bytes
+    def evict(self):
+        index = self.index()
+        total = self.total_bytes(index)
+        if total <= self.max_bytes:
+            return
+        removed = []
+        index.execute("BEGIN IMMEDIATE")
+        try:
+            total = self.total_bytes(index)
+            rows = index.execute("SELECT key, digest, mimetype, size FROM media ORDER BY used").fetchall()
+            for key, digest, mimetype, size in rows:
+                if total <= self.max_bytes:
+                    break
+                index.execute("DELETE FROM media WHERE key = ?", (key,))
+                if index.execute("SELECT 1 FROM media WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+                    removed.append(self.path(digest, mimetype))
+                    total -= size
+            index.execute("COMMIT")
+        except BaseException:
+            index.execute("ROLLBACK")
+            raise
+        for path in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.count("evictions", len(removed))
+
+    def stats(self):
+        index = self.index()
+        entries = index.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+        with self.lock:
+            return dict(self.counters, entries=entries, bytes=self.total_bytes(index), max_bytes=self.max_bytes)
+
+
+# Refuses redirects that leave MEDIA_ALLOWED_HOSTS, which urlopen would otherwise follow
+class AllowedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not downloadable(newurl):
+            return None
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+opener = urllib.request.build_opener(AllowedRedirectHandler)
+
+
+def download(url):
+    request = urllib.request.Request(url, headers={"User-Agent": "steam-games-api media cache"})
+    with opener.open(request, timeout=MEDIA_FETCH_TIMEOUT) as response:
+        mimetype = response.headers.get_content_type()
+        if mimetype not in MEDIA_MIMETYPES:
+            raise ValueError(f"Unsupported media type '{mimetype}' for {url}")
+        body = response.read(MEDIA_MAX_BYTES + 1)
+    if len(body) > MEDIA_MAX_BYTES:
+        raise ValueError(f"Image over {MEDIA_MAX_BYTES} bytes at {url}")
+    return body, mimetype
+
+
+# Scales down to the width keeping the aspect ratio; images already narrower are kept as they are
+def resize(body, mimetype, width):
+    image = Image.open(io.BytesIO(body))
+    if image.width <= width:
+        return body, mimetype
+    height = max(1, round(image.height * width / image.width))
+    image = image.convert("RGBA" if "A" in image.getbands() else "RGB").resize((width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    if image.mode == "RGBA":
+        image.save(output, "PNG", optimize=True)
+        return output.getvalue(), "image/png"
+    image.save(output, "JPEG", quality=85, optimize=True)
+    return output.getvalue(), "image/jpeg"
+
+
+# A fixed number of daemon threads fed by a bounded queue. A job downloads an image once and makes
+# the resized copies from the cached original; when the queue is full, requests drop their job and
+# only the blocking prefetch command waits for room.
+class MediaFetcher:
+    def __init__(self, cache, workers=MEDIA_WORKERS, queue_size=MEDIA_QUEUE_SIZE):
+        self.cache = cache
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = None
+        self.pending = set()
+        # url -> time of the last failed download, oldest first and bounded like the queue
+        self.failures = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"fetched": 0, "resized": 0, "failed": 0, "dropped": 0, "retries_skipped": 0}
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def submit(self, url, widths=(), block=False):
+        if not downloadable(url):
+            return False
+        job = (url, tuple(widths) if Image is not None else ())
+        with self.lock:
+            if self.jobs is None:
+                self.jobs = queue.Queue(maxsize=self.queue_size)
+                for _ in range(self.workers):
+                    threading.Thread(target=self.run, daemon=True).start()
+            if job in self.pending:
+                return True
+            failed = self.failures.get(url)
+            if failed is not None and failed > time.monotonic() - MEDIA_RETRY_SECONDS:
+                self.counters["retries_skipped"] += 1
+                return False
+            self.pending.add(job)
+        try:
+            self.jobs.put(job, block=block)
+        except queue.Full:
+            with self.lock:
+                self.pending.discard(job)
+                self.counters["dropped"] += 1
+            return False
+        return True
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.fetch(*job)
+            except Exception as e:
+                with self.lock:
+                    self.counters["failed"] += 1
+                    self.failures[job[0]] = time.monotonic()
+                    self.failures.move_to_end(job[0])
+                    while len(self.failures) > self.queue_size:
+                        self.failures.popitem(last=False)
+                print(f"Media fetch of {job[0]} failed: {e}", file=sys.stderr)
+            finally:
+                with self.lock:
+                    self.pending.discard(job)
+                self.jobs.task_done()
+
+    def fetch(self, url, widths):
+        original = self.cache.get(url)
+        if original is None:
+            body, mimetype = download(url)
+            self.cache.put(url, None, body, mimetype)
+            self.count("fetched")
+        else:
+            with open(original["path"], "rb") as f:
+                body, mimetype = f.read(), original["mimetype"]
+        for width in widths:
+            if self.cache.get(url, width) is None:
+                self.cache.put(url, width, *resize(body, mimetype, width))
+                self.count("resized")
+
+    def wait(self):
+        if self.jobs is not None:
+            self.jobs.join()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, pending=len(self.pending), workers=self.workers, queue_size=self.queue_size)
+
+
+media_cache = MediaCache()
+media_fetcher = MediaFetcher(media_cache)
+
+
+# The cached image at the width, else the cached original while the resized copy is made, else None
+# while the download runs in the background
+def cached_image(url, width=None):
+    if width and Image is not None:
+        entry = media_cache.get(url, width)
+        if entry is not None:
+            media_cache.count("hits")
+            return entry
+    entry = media_cache.get(url)
+    if entry is None or (width and Image is not None):
+        media_cache.count("misses")
+        media_fetcher.submit(url, [width] if width else [])
+    else:
+        media_cache.count("hits")
+    return entry
+
+
+def stats():
+    return {"cache": media_cache.stats(), "fetcher": media_fetcher.stats(), "resize": Image is not None}
+
+
+# Queues the images of every game (with the resized widths) and waits for the pool to drain them
+def prefetch(limit=None):
+    started = time.perf_counter()
+    queued = 0
+    cursor = main.database.games.find({}, dict.fromkeys(MEDIA_FIELDS, 1), batch_size=1000)
+    if limit:
+        cursor = cursor.limit(limit)
+    for game in cursor:
+        for field in MEDIA_FIELDS:
+            url = game.get(field)
+            if isinstance(url, str) and media_fetcher.submit(url, MEDIA_WIDTHS, block=True):
+                queued += 1
+    media_fetcher.wait()
+    print(f"Processed {queued} images in {time.perf_counter() - started:.1f}s: {stats()}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != "prefetch":
+        print("Usage: python media.py prefetch [limit]")
+        sys.exit(1)
+    prefetch(int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,169 @@
+import http.server
+import os
+import threading
+import types
+
+import pytest
+
+import main
+import media
+
+
+# Stand-in origin for the image URLs: serves IMAGES, counts the requests per path and answers
+# /redirect-out with a redirect to a host outside MEDIA_ALLOWED_HOSTS
+IMAGES = {f"/img/{n}.jpg": b"\xff\xd8" + bytes([n]) * 4000 for n in range(4)}
+IMAGES["/img/copy.jpg"] = IMAGES["/img/0.jpg"]
+
+
+class OriginHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        if self.path == "/redirect-out":
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{self.server.server_port}/img/1.jpg")
+            self.end_headers()
+            return
+        body = IMAGES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Games:
+    def __init__(self, games):
+        self.games = {game["_id"]: game for game in games}
+
+    def find_one(self, query, projection):
+        game = self.games.get(query["_id"])
+        return game and {field: game[field] for field in projection if field in game}
+
+
+@pytest.fixture
+def origin():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    server.hits = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, origin):
+    cache = media.MediaCache(str(tmp_path / "media"), max_bytes=10000)
+    monkeypatch.setattr(media, "MEDIA_ALLOWED_HOSTS", {"127.0.0.1"})
+    monkeypatch.setattr(media, "media_cache", cache)
+    monkeypatch.setattr(media, "media_fetcher", media.MediaFetcher(cache, workers=2, queue_size=10))
+    base = f"http://127.0.0.1:{origin.server_port}"
+    games = [{"_id": n, "header_img": f"{base}/img/{n}.jpg", "website": f"https://example.com/{n}"} for n in range(4)]
+    games += [{"_id": 10, "header_img": f"{base}/img/copy.jpg", "background_img": f"{base}/redirect-out"},
+              {"_id": 11, "header_img": f"http://localhost:{origin.server_port}/img/2.jpg",
+               "background_img": "No Data Available", "website": "No Data Available"}]
+    monkeypatch.setattr(main, "database", types.SimpleNamespace(games=Games(games)))
+    return cache
+
+
+@pytest.fixture
+def client(cache):
+    return main.app.test_client()
+
+
+def fetch(client, path, **kwargs):
+    response = client.get(path, **kwargs)
+    media.media_fetcher.wait()
+    return response
+
+
+def test_miss_redirects_to_origin_and_queues_download(client, origin):
+    response = fetch(client, "/games/0/header_img")
+    assert response.status_code == 302
+    assert response.headers["Location"] == f"http://127.0.0.1:{origin.server_port}/img/0.jpg"
+
+    response = client.get("/games/0/header_img")
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.get_data() == IMAGES["/img/0.jpg"]
+    assert origin.hits["/img/0.jpg"] == 1
+
+
+def test_hit_has_content_hash_etag_and_answers_if_none_match(client):
+    fetch(client, "/games/0/header_img")
+    response = client.get("/games/0/header_img")
+    etag = response.headers["ETag"].strip('"')
+    assert etag == media.hashlib.sha256(IMAGES["/img/0.jpg"]).hexdigest()
+    assert "max-age=86400" in response.headers["Cache-Control"]
+
+    response = client.get("/games/0/header_img", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+
+def test_range_request(client):
+    fetch(client, "/games/0/header_img")
+    response = client.get("/games/0/header_img", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(IMAGES['/img/0.jpg'])}"
+    assert response.get_data() == IMAGES["/img/0.jpg"][100:200]
+
+
+def test_same_bytes_are_stored_once(client, cache):
+    fetch(client, "/games/0/header_img")
+    fetch(client, "/games/10/header_img")
+    assert client.get("/games/10/header_img").headers["ETag"] == client.get("/games/0/header_img").headers["ETag"]
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == len(IMAGES["/img/0.jpg"])
+
+
+def test_least_recently_used_images_are_evicted_past_max_bytes(client, cache):
+    for n in range(4):
+        fetch(client, f"/games/{n}/header_img")
+    stats = cache.stats()
+    assert stats["bytes"] <= cache.max_bytes
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 2
+    files = [name for _, _, names in os.walk(cache.directory) for name in names if name.endswith(".jpg")]
+    assert len(files) == 2
+
+    assert client.get("/games/0/header_img").status_code == 302
+    assert client.get("/games/3/header_img").status_code == 200
+
+
+def test_hosts_outside_the_allowed_list_are_only_redirected_to(client, origin):
+    response = fetch(client, "/games/11/header_img")
+    assert response.status_code == 302
+    assert response.headers["Location"].startswith("http://localhost:")
+    assert fetch(client, "/games/11/header_img").status_code == 302
+    assert "/img/2.jpg" not in origin.hits
+
+
+def test_redirects_leaving_the_allowed_hosts_are_not_followed(client, origin):
+    assert fetch(client, "/games/10/background_img").status_code == 302
+    assert origin.hits["/redirect-out"] == 1
+    assert "/img/1.jpg" not in origin.hits
+    assert media.media_fetcher.stats()["failed"] == 1
+
+    # The failed URL is not downloaded again until MEDIA_RETRY_SECONDS have passed
+    assert fetch(client, "/games/10/background_img").status_code == 302
+    assert origin.hits["/redirect-out"] == 1
+
+
+def test_invalid_requests(client):
+    assert client.get("/games/0/header_img?width=7").status_code == 400
+    assert client.get("/games/99/header_img").status_code == 404
+    assert client.get("/games/11/background_img").status_code == 404
+
+
+def test_website_redirects(client):
+    response = client.get("/games/2/website")
+    assert response.status_code == 302
+    assert response.headers["Location"] == "https://example.com/2"
+    assert client.get("/games/11/website").status_code == 404